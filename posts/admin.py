@@ -1,4 +1,5 @@
 from django.contrib import admin
+from . import search
 from .models import Comment, Follow, Post, Group
 
 
@@ -8,6 +9,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',) 
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.enabled():
+            return super().get_search_results(
+                request, queryset, search_term)
+        queryset = queryset.filter(
+            pk__in=search.matching_post_ids(search_term))
+        return queryset, False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description') 
@@ -0,0 +1,216 @@
+"""
+Versioned JSON API for the feeds, plus follow/unfollow.
+
+Every list is keyset-paginated with the same cursor paginators and feed
+querysets as the HTML views, accepts ?fields= to trim the payload and
+?limit= to size the page, and answers If-None-Match with 304. For the
+index, group, profile and post detail the ETag is derived from the
+fragment cache version of the scope (see posts.fragments), so a
+revalidation that hits is answered without touching the posts table.
+
+The follow and unfollow endpoints take a POST (with the CSRF token, like
+any form on the site) and answer the new state with the counters, so the
+profile page's button updates without reloading the page.
+"""
+import hashlib
+
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET, require_POST
+
+from . import follows, fragments, usernames
+from .models import Group, Post
+from .paginators import cursor_paginator
+from .timeline import Timeline
+from yatube.routers import replica_reads
+
+PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'author': lambda post: post.author.username,
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date.isoformat(),
+    'image': lambda post: post.image.url if post.image else None,
+    'comments_count': lambda post: post.comments_count,
+}
+
+COMMENT_FIELDS = {
+    'id': lambda comment: comment.pk,
+    'author': lambda comment: comment.author.username,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: comment.created.isoformat(),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={
+        'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def _error(message, status):
+    return _json({'error': message}, status=status)
+
+
+def _fields(request):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(POST_FIELDS)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in POST_FIELDS]
+    if unknown:
+        raise BadRequest(f'unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit must be a number')
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def _serialize(obj, fields, getters):
+    return {name: getters[name](obj) for name in fields}
+
+
+def _etag(*parts):
+    raw = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def _respond(request, data, etag=None):
+    response = _json(data)
+    if etag is None:
+        etag = _etag(response.content)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    response['ETag'] = etag
+    return response
+
+
+def _page(queryset, request, fields, limit, date_field='pub_date',
+          getters=POST_FIELDS):
+    page = cursor_paginator(queryset, limit, date_field).get_page(
+        request.GET.get('cursor'))
+    return {
+        'results': [_serialize(obj, fields, getters) for obj in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def _feed(request, queryset, scope=None):
+    try:
+        fields, limit = _fields(request), _limit(request)
+    except BadRequest as error:
+        return _error(str(error), 400)
+    etag = None
+    if scope is not None:
+        etag = _etag(scope, fragments.version(scope),
+                     request.GET.urlencode())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+    return _respond(request, _page(queryset, request, fields, limit), etag)
+
+
+@replica_reads()
+@require_GET
+def index(request):
+    return _feed(request, Post.objects.for_feed(), 'index')
+
+
+@replica_reads()
+@require_GET
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return _error('group not found', 404)
+    return _feed(
+        request, group.group_posts.for_feed(), f'group:{group.pk}')
+
+
+@replica_reads()
+@require_GET
+def profile(request, username):
+    author_id = usernames.resolve(username)
+    if author_id is None:
+        return _error('user not found', 404)
+    return _feed(request, Post.objects.filter(author_id=author_id).for_feed(),
+                 f'profile:{author_id}')
+
+
+@replica_reads()
+@require_GET
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return _error('authentication required', 401)
+    response = _feed(request, Timeline(request.user))
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+@replica_reads()
+@require_GET
+def post_detail(request, post_id):
+    """A post with the newest comments; ?cursor= pages the comments."""
+    try:
+        fields, limit = _fields(request), _limit(request)
+    except BadRequest as error:
+        return _error(str(error), 400)
+    scope = f'post:{post_id}'
+    etag = _etag(scope, fragments.version(scope), request.GET.urlencode())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    post = Post.objects.for_feed().filter(pk=post_id).first()
+    if post is None:
+        return _error('post not found', 404)
+    comments = post.post_comments.select_related('author')
+    data = _serialize(post, fields, POST_FIELDS)
+    data['comments'] = _page(
+        comments, request, list(COMMENT_FIELDS), limit,
+        date_field='created', getters=COMMENT_FIELDS)
+    return _respond(request, data, etag)
+
+
+def _follow_action(request, username, following):
+    if not request.user.is_authenticated:
+        return _error('authentication required', 401)
+    author_id = usernames.resolve(username)
+    if author_id is None:
+        return _error('user not found', 404)
+    if author_id == request.user.pk:
+        return _error('cannot follow yourself', 400)
+    if following:
+        follows.follow(request.user.pk, author_id)
+    else:
+        follows.unfollow(request.user.pk, author_id)
+    return _json({
+        'following': following,
+        **follows.counts(request.user.pk, author_id),
+    })
+
+
+@require_POST
+def follow(request, username):
+    """Follows the author; answers the new state, the author's
+    followers_count and the viewer's following_count. Repeating it is
+    harmless."""
+    return _follow_action(request, username, True)
+
+
+@require_POST
+def unfollow(request, username):
+    return _follow_action(request, username, False)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from yatube.db import apply_pragmas
+        from . import signals  # noqa
+        connection_created.connect(apply_pragmas)
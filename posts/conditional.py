@@ -0,0 +1,48 @@
+"""
+ETag validators for the post, profile and group pages.
+
+An ETag is the hash of the fragment versions (see posts.fragments) of
+everything the page shows, the viewer and the query string, so a revisit
+is answered with 304 after at most one indexed lookup and without rendering.
+Post saves, comments, follows and user edits bump those versions from
+posts.signals. The viewer's CSRF secret is hashed in too: the comment
+form and the follow button carry a token, and a new login rotates it.
+Last-Modified is not sent: an edited post keeps its pub_date, so a date
+validator would hide edits.
+"""
+import hashlib
+
+from . import fragments, usernames
+from .models import Group, Post
+
+
+def _etag(request, page, scopes):
+    parts = [page, request.get_full_path(), str(request.user.pk),
+             request.META.get('CSRF_COOKIE', '')]
+    parts += [f'{scope}={fragments.version(scope)}' for scope in scopes]
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def profile_etag(request, username):
+    author_id = usernames.resolve(username)
+    if author_id is None:
+        return None
+    return _etag(request, 'profile', [
+        f'profile:{author_id}', f'user:{author_id}'])
+
+
+def post_etag(request, username, post_id):
+    author_id = usernames.resolve(username)
+    if author_id is None or not Post.objects.filter(
+            pk=post_id, author_id=author_id).exists():
+        return None
+    return _etag(request, 'post', [
+        f'post:{post_id}', f'profile:{author_id}', f'user:{author_id}'])
+
+
+def group_etag(request, slug):
+    group_id = Group.objects.filter(
+        slug=slug).values_list('pk', flat=True).first()
+    if group_id is None:
+        return None
+    return _etag(request, 'group', [f'group:{group_id}'])
@@ -0,0 +1,91 @@
+"""
+Denormalized counters.
+
+Post.comments_count and the UserStats row of every user are adjusted with
+single UPDATE ... SET x = x + 1 statements from the same transaction that
+writes the comment, follow or post, so pages read them instead of running
+COUNT(*) queries. The recount_counters command repairs any drift.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _count_of(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def _user_counts():
+    return {
+        'posts_count': _count_of(Post.objects.all(), 'author'),
+        'followers_count': _count_of(
+            Follow.objects.filter(user__isnull=False), 'author'),
+        'following_count': _count_of(
+            Follow.objects.filter(author__isnull=False), 'user'),
+    }
+
+
+def recount_user(user_id):
+    counts = User.objects.filter(pk=user_id).values(**_user_counts()).first()
+    if counts is None:
+        return None
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id, defaults=counts)
+    return stats
+
+
+def bump_user(user_id, field, delta):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)})
+    if not updated and delta > 0:
+        recount_user(user_id)
+
+
+def bump_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Greatest(F('comments_count') + delta, 0))
+
+
+def stats_for(user):
+    """Returns the user's counters, creating the row on first access."""
+    try:
+        return UserStats.objects.get(user=user)
+    except UserStats.DoesNotExist:
+        return recount_user(user.pk)
+
+
+def stats_with_user(user_id):
+    """Like stats_for, but loads the user along with the counters;
+    None if there is no such user."""
+    stats = UserStats.objects.select_related('user').filter(
+        user_id=user_id).first()
+    return stats if stats is not None else recount_user(user_id)
+
+
+def recount_all():
+    """Recomputes every counter in a handful of set-based statements."""
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk)
+         for pk in User.objects.values_list('pk', flat=True).iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    users = UserStats.objects.update(**{
+        field: Subquery(
+            User.objects.filter(pk=OuterRef('user'))
+            .annotate(value=expression).values('value'),
+            output_field=IntegerField(),
+        )
+        for field, expression in _user_counts().items()
+    })
+    posts = Post.objects.update(
+        comments_count=_count_of(Comment.objects.all(), 'post'))
+    return users, posts
@@ -0,0 +1,86 @@
+"""
+Idempotent follow and unfollow.
+
+Each is one statement keyed on the unique (user, author) pair: INSERT ...
+ON CONFLICT DO NOTHING and a DELETE by both columns, both RETURNING the id
+of the row they touched (SQLite 3.35+). Only when there is one are the
+post_save / post_delete receivers of Follow run, in the same transaction
+and with the saved row's pk, so the counters, timeline and fragment
+versions move exactly once however many concurrent or repeated requests
+arrive. The old exists() followed by create() could race into an
+IntegrityError or a counter bumped twice.
+"""
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+
+from .models import Follow, UserStats
+from yatube import routers
+from yatube.db import atomic_retry
+
+
+def _sql(template):
+    opts = Follow._meta
+    return template.format(
+        table=connection.ops.quote_name(opts.db_table),
+        user=connection.ops.quote_name(opts.get_field('user').column),
+        author=connection.ops.quote_name(opts.get_field('author').column),
+        id=connection.ops.quote_name(opts.pk.column),
+    )
+
+
+def _execute(sql, user_id, author_id):
+    """Runs a statement returning the id of the row it touched and gives
+    that row as a Follow, or None if it touched none."""
+    routers.note_write()
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(sql), [user_id, author_id])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    follow = Follow(pk=row[0], user_id=user_id, author_id=author_id)
+    # Receivers get it as a row from the database, like Model.save()'s.
+    follow._state.adding = False
+    follow._state.db = connection.alias
+    return follow
+
+
+def _follow(user_id, author_id):
+    follow = _execute(
+        'INSERT INTO {table} ({user}, {author}) VALUES (%s, %s) '
+        'ON CONFLICT DO NOTHING RETURNING {id}', user_id, author_id)
+    if follow is None:
+        return False
+    post_save.send(
+        Follow, instance=follow, created=True, update_fields=None,
+        raw=False, using=connection.alias)
+    return True
+
+
+def _unfollow(user_id, author_id):
+    follow = _execute(
+        'DELETE FROM {table} WHERE {user} = %s AND {author} = %s '
+        'RETURNING {id}', user_id, author_id)
+    if follow is None:
+        return False
+    post_delete.send(Follow, instance=follow, using=connection.alias)
+    return True
+
+
+def follow(user_id, author_id):
+    """Makes the user follow the author; True if they did not before."""
+    return atomic_retry(_follow, user_id, author_id)
+
+
+def unfollow(user_id, author_id):
+    """Ends the follow; True if there was one."""
+    return atomic_retry(_unfollow, user_id, author_id)
+
+
+def counts(user_id, author_id):
+    """The counters the follow button shows next to itself."""
+    stats = {row.user_id: row for row in UserStats.objects.filter(
+        user_id__in=[user_id, author_id])}
+    return {
+        'followers_count': getattr(stats.get(author_id), 'followers_count', 0),
+        'following_count': getattr(stats.get(user_id), 'following_count', 0),
+    }
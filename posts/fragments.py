@@ -0,0 +1,90 @@
+"""
+Version counters for the feed fragment cache.
+
+Templates put the current version of a scope into their {% cache %} keys;
+bumping the version after a write makes every fragment built from the old
+data unreachable at once, so pages are fresh right after new_post,
+post_edit or add_comment instead of after a blind TTL. Post and comment
+saves bump their scopes from posts.signals.
+
+Scopes: 'index', 'group:<id>', 'profile:<author id>' for whole feed pages,
+'post:<id>' for a single rendered post_item.html and 'user:<id>' for the
+user's names and follow counters shown next to their posts. A post item
+is keyed on item_scopes(), and a feed page on those of all its posts too,
+so renaming an author or a group reaches every cached page showing them.
+
+Inside a request that reads a replica, version() also carries the
+replica's sync generation, so what is rendered from lagging data is
+cached (and ETagged) apart from the primary's pages and expires with the
+next sync_replicas run instead of outliving it.
+"""
+import time
+
+from django.core.cache import cache
+
+from yatube import routers
+
+
+def _key(scope):
+    return f'fragment-version:{scope}'
+
+
+def _initial():
+    # A lost counter restarts from the clock, never from a value that
+    # fragments cached before the eviction could still be keyed on.
+    return int(time.time() * 1000)
+
+
+def _with_replica(value):
+    replica = routers.snapshot()
+    return value if replica is None else f'{value}@{replica}'
+
+
+def _stored(scope):
+    value = cache.get(_key(scope))
+    if value is None:
+        value = _initial()
+        if not cache.add(_key(scope), value, None):
+            value = cache.get(_key(scope), value)
+    return value
+
+
+def version(scope):
+    return _with_replica(_stored(scope))
+
+
+def versions(scopes):
+    """version() of each scope, read in one cache round trip."""
+    found = cache.get_many([_key(scope) for scope in scopes])
+    return [_with_replica(found[_key(scope)] if _key(scope) in found
+                          else _stored(scope))
+            for scope in scopes]
+
+
+def item_scopes(post):
+    """What one rendered post shows: the post, its author's name and its
+    group's title."""
+    scopes = [f'post:{post.pk}', f'user:{post.author_id}']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def bump(*scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.set(_key(scope), _initial(), None)
+
+
+def post_scopes(post):
+    scopes = ['index', f'profile:{post.author_id}', f'post:{post.pk}']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def invalidate_post(post):
+    """Drops every cached fragment that shows this post."""
+    bump(*post_scopes(post))
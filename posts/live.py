@@ -0,0 +1,101 @@
+"""
+New-post notifications for the live feed endpoint (views.live_posts).
+
+publish() runs once a new post is committed: it stores the post's id as
+the head of every feed the post appears in, under a cache key, and wakes
+the streams waiting in this process. wait() sleeps on a Condition and
+re-reads the heads between wake-ups, so posts published by other worker
+processes reach it through a shared cache (YATUBE_CACHE=shared) within
+POLL_INTERVAL. Waiting clients never poll the database; it is queried
+only when a head moves past the client's cursor.
+
+Waiting holds a worker, so it only happens with settings.LIVE_FEED =
+'stream' on threaded or async workers; 'poll' answers every request at
+once and 'off', the default, turns the endpoint off.
+
+Post ids grow with pub_date, so the last seen id is the client cursor.
+The follow feed has no head of its own and wakes on every new post.
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+POLL_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15
+BATCH_SIZE = 20
+
+_changed = threading.Condition()
+
+
+def _key(scope):
+    return f'live-head:{scope}'
+
+
+def feed_scopes(post):
+    scopes = ['index']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def head(scope):
+    return cache.get(_key(scope), 0)
+
+
+def publish(post):
+    for scope in feed_scopes(post):
+        cache.set(_key(scope), post.pk, None)
+    with _changed:
+        _changed.notify_all()
+
+
+def wait(scope, after, timeout):
+    """Blocks until the feed has a post newer than `after` or timeout
+    seconds pass; returns the feed's head."""
+    deadline = time.monotonic() + timeout
+    while True:
+        latest = head(scope)
+        remaining = deadline - time.monotonic()
+        if latest > after or remaining <= 0:
+            return latest
+        with _changed:
+            _changed.wait(min(POLL_INTERVAL, remaining))
+
+
+def poll(scope, after, fetch, timeout):
+    """One long-poll round: waits for news, then returns the new
+    (id, html) pairs from fetch(after) and the client's next cursor."""
+    latest = wait(scope, after, timeout)
+    if latest <= after:
+        return [], after
+    posts = fetch(after)
+    if len(posts) == BATCH_SIZE:
+        return posts, posts[-1][0]
+    # Everything up to the head is seen, also when none of it was in
+    # this feed (the follow feed wakes on every post).
+    return posts, max([latest] + [pk for pk, _ in posts])
+
+
+def _event(pk, html):
+    data = json.dumps({'id': pk, 'html': html})
+    return f'id: {pk}\nevent: post\ndata: {data}\n\n'
+
+
+def stream(scope, after, fetch):
+    """Server-Sent Events for LIVE_STREAM_SECONDS; the browser's
+    EventSource reconnects afterwards with Last-Event-ID."""
+    yield f'retry: {int(POLL_INTERVAL * 1000)}\n\n'
+    deadline = time.monotonic() + getattr(settings, 'LIVE_STREAM_SECONDS', 55)
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        posts, after = poll(
+            scope, after, fetch, min(KEEPALIVE_INTERVAL, remaining))
+        if not posts:
+            yield ': keepalive\n\n'
+        for pk, html in posts:
+            yield _event(pk, html)
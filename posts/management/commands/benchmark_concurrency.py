@@ -0,0 +1,116 @@
+import json
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Post, User
+from yatube.db import is_locked
+
+from .benchmark_views import percentile
+
+
+class Command(BaseCommand):
+    help = ('Runs concurrent readers and comment writers against the '
+            'current database and reports throughput, latency and '
+            '"database is locked" failures. Compare runs with and without '
+            'YATUBE_DB_PROFILE=production.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--duration', type=float, default=10.0,
+            help='Seconds to run for.')
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='Share of requests that post a comment.')
+        parser.add_argument(
+            '--output', default=None,
+            help='Optional JSON file the results are written to.')
+
+    def worker(self, users, posts, options, deadline, results):
+        client = Client()
+        client.force_login(random.choice(users))
+        rng = random.Random()
+        while time.perf_counter() < deadline:
+            writing = rng.random() < options['write_ratio']
+            post = rng.choice(posts)
+            started = time.perf_counter()
+            try:
+                if writing:
+                    client.post(
+                        reverse('add_comment', args=[
+                            post.author.username, post.pk]),
+                        {'text': 'Benchmark comment'})
+                else:
+                    client.get(reverse('index'))
+            except OperationalError as error:
+                results['locked' if is_locked(error) else 'errors'] += 1
+                continue
+            results['writes' if writing else 'reads'].append(
+                (time.perf_counter() - started) * 1000)
+        connection.close()
+
+    def handle(self, *args, **options):
+        users = list(User.objects.all()[:50])
+        posts = list(Post.objects.select_related('author').order_by(
+            '-pub_date')[:200])
+        if not users or not posts:
+            self.stderr.write('Nothing to measure, run seed_data first.')
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            (journal_mode,) = cursor.fetchone()
+
+        results = {'reads': [], 'writes': [], 'locked': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def run():
+            local = {'reads': [], 'writes': [], 'locked': 0, 'errors': 0}
+            self.worker(users, posts, options, deadline, local)
+            with lock:
+                for key, value in local.items():
+                    results[key] += value
+
+        deadline = time.perf_counter() + options['duration']
+        threads = [threading.Thread(target=run)
+                   for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        report = {
+            'created': timezone.now().isoformat(),
+            'journal_mode': journal_mode,
+            'conn_max_age': settings.DATABASES['default'].get(
+                'CONN_MAX_AGE', 0),
+            'threads': options['threads'],
+            'duration_s': round(elapsed, 2),
+            'requests_per_s': round(
+                (len(results['reads']) + len(results['writes'])) / elapsed,
+                1),
+            'locked': results['locked'],
+            'errors': results['errors'],
+        }
+        for kind in ('reads', 'writes'):
+            timings = results[kind]
+            report[kind] = {
+                'count': len(timings),
+                'p50_ms': round(percentile(timings, 0.5), 2)
+                if timings else None,
+                'p99_ms': round(percentile(timings, 0.99), 2)
+                if timings else None,
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
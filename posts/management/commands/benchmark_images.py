@@ -0,0 +1,83 @@
+import json
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import get_thumbnail
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Compares the bytes a feed page downloads for post images: the '
+            'single 960x339 JPEG against the responsive variant a client '
+            'of the given width picks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size', type=int, default=10,
+            help='Posts per feed page.')
+        parser.add_argument(
+            '--viewport', type=int, nargs='+', default=[360, 768, 1280],
+            help='Client CSS widths to simulate.')
+        parser.add_argument(
+            '--dpr', type=float, default=2.0,
+            help='Device pixel ratio of the simulated clients.')
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Print the report as JSON.')
+
+    def pick(self, image, viewport, dpr):
+        """The variant a browser selects: the first format in <source>
+        order and the narrowest width covering the rendered pixels."""
+        wanted = min(viewport, 730) * dpr
+        widths = [w for w in thumbnails.WIDTHS if w >= wanted]
+        width = widths[0] if widths else thumbnails.WIDTHS[-1]
+        for _, extension, _ in thumbnails.formats():
+            name = thumbnails.variant_name(image.name, width, extension)
+            if default_storage.exists(name):
+                return default_storage.size(name)
+        return None
+
+    def handle(self, *args, **options):
+        posts = list(
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by('-pub_date')[:options['page_size']])
+        geometry, thumb_options = thumbnails.VARIANTS[0]
+        legacy = 0
+        picked = {viewport: 0 for viewport in options['viewport']}
+        for post in posts:
+            thumbnails.generate(post.image)
+            thumb = get_thumbnail(post.image, geometry, **thumb_options)
+            legacy_size = default_storage.size(thumb.name)
+            legacy += legacy_size
+            for viewport in picked:
+                size = self.pick(post.image, viewport, options['dpr'])
+                picked[viewport] += legacy_size if size is None else size
+
+        report = {
+            'posts': len(posts),
+            'formats': [name for name, _, _ in thumbnails.formats()],
+            'dpr': options['dpr'],
+            'legacy_bytes': legacy,
+            'viewports': {
+                str(viewport): {
+                    'bytes': size,
+                    'saved_bytes': legacy - size,
+                    'saved_percent': round(
+                        100 * (legacy - size) / legacy, 1) if legacy else 0,
+                }
+                for viewport, size in picked.items()
+            },
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f"{report['posts']} images per page, formats: "
+            f"{', '.join(report['formats'])}, dpr {report['dpr']}")
+        self.stdout.write(f'960x339 JPEG: {legacy} bytes per page')
+        for viewport, row in report['viewports'].items():
+            self.stdout.write(
+                f"{viewport:>5}px: {row['bytes']} bytes, "
+                f"saved {row['saved_bytes']} ({row['saved_percent']}%)")
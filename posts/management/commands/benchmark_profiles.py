@@ -0,0 +1,107 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter per measurement, so imports are cold.
+PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from yatube.wsgi import application
+startup = time.perf_counter() - started
+
+from django.test import Client
+client = Client(SERVER_NAME='localhost')
+timings = {}
+for url in sys.argv[1:]:
+    for _ in range(int(os.environ['PROBE_WARMUP'])):
+        client.get(url)
+    values = []
+    for _ in range(int(os.environ['PROBE_REQUESTS'])):
+        begin = time.perf_counter()
+        response = client.get(url)
+        values.append((time.perf_counter() - begin) * 1000)
+        assert response.status_code == 200, (url, response.status_code)
+    timings[url] = values
+print(json.dumps({'startup_ms': startup * 1000, 'timings': timings}))
+'''
+
+PROFILES = ('development', 'production')
+
+
+class Command(BaseCommand):
+    help = ('Compares the settings profiles (YATUBE_PROFILE): cold-start '
+            'time of the WSGI application and steady-state latency of a '
+            'few pages, each profile in its own fresh interpreter.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Fresh interpreters per profile.')
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--url', action='append', dest='urls',
+            help='Page to request; repeatable. Defaults to / and /search/.')
+        parser.add_argument('--output', default=None,
+                            help='Optional JSON file for the results.')
+
+    def run(self, profile, args, static_root, options):
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE='yatube.settings',
+            YATUBE_PROFILE=profile,
+            # Each profile gets the static files its storage collected.
+            YATUBE_STATIC_ROOT=static_root,
+            PROBE_REQUESTS=str(options['requests']),
+            PROBE_WARMUP=str(options['warmup']),
+        )
+        result = subprocess.run(
+            [sys.executable, *args], cwd=settings.BASE_DIR,
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        if result.returncode:
+            raise CommandError(f'{profile} run failed:\n{result.stderr}')
+        return result.stdout
+
+    def probe(self, profile, urls, static_root, options):
+        output = self.run(
+            profile, ['-c', PROBE, *urls], static_root, options)
+        return json.loads(output.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or ['/', '/search/']
+        report = {}
+        for profile in PROFILES:
+            with tempfile.TemporaryDirectory() as static_root:
+                self.run(profile, ['manage.py', 'collectstatic', '--noinput',
+                                   '--verbosity', '0'], static_root, options)
+                runs = [self.probe(profile, urls, static_root, options)
+                        for _ in range(options['runs'])]
+            row = {
+                'startup_ms': round(statistics.median(
+                    run['startup_ms'] for run in runs), 1),
+                'requests': {},
+            }
+            for url in urls:
+                timings = sorted(
+                    value for run in runs for value in run['timings'][url])
+                row['requests'][url] = {
+                    'p50_ms': round(statistics.median(timings), 2),
+                    'mean_ms': round(statistics.mean(timings), 2),
+                }
+            report[profile] = row
+            pages = '  '.join(
+                f"{url} p50 {stats['p50_ms']} ms"
+                for url, stats in row['requests'].items())
+            self.stdout.write(
+                f"{profile:<12} startup {row['startup_ms']:>7} ms  {pages}")
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
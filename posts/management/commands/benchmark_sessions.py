@@ -0,0 +1,95 @@
+import json
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import UserStats
+
+from .benchmark_views import percentile
+
+
+class Command(BaseCommand):
+    help = ('Measures requests per second of a login_required page with '
+            'each session engine in settings.SESSION_ENGINES, and how many '
+            'of its queries touch the session table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Clients requesting at once; --requests is per client.')
+        parser.add_argument(
+            '--url', default=None,
+            help='Page to request; defaults to the follow feed.')
+        parser.add_argument('--output', default=None,
+                            help='Optional JSON file for the results.')
+
+    def run(self, client, url, options, timings, session_queries):
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as captured:
+                begin = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - begin) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} answered {response.status_code}')
+            session_queries.append(sum(
+                'django_session' in query['sql'] for query in captured))
+        connection.close()
+
+    def measure(self, engine, user, url, options):
+        with override_settings(SESSION_ENGINE=engine):
+            # A new client builds a new handler, whose SessionMiddleware
+            # picks up the engine.
+            clients = []
+            for _ in range(options['threads']):
+                client = Client()
+                client.force_login(user)
+                for _ in range(options['warmup']):
+                    client.get(url)
+                clients.append(client)
+            timings, session_queries = [], []
+            threads = [
+                threading.Thread(target=self.run, args=(
+                    client, url, options, timings, session_queries))
+                for client in clients]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        if len(timings) != options['requests'] * options['threads']:
+            raise RuntimeError(f'{engine} run failed, see the errors above.')
+        return {
+            'requests_per_s': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'session_queries': statistics.median(session_queries),
+        }
+
+    def handle(self, *args, **options):
+        reader = UserStats.objects.select_related('user').order_by(
+            '-following_count').first()
+        if reader is None:
+            self.stderr.write('Nothing to measure, run seed_data first.')
+            return
+        url = options['url'] or reverse('follow_index')
+        report = {}
+        for name, engine in settings.SESSION_ENGINES.items():
+            row = report[name] = self.measure(
+                engine, reader.user, url, options)
+            self.stdout.write(
+                f"{name:<15} {row['requests_per_s']:>8} req/s  "
+                f"p50 {row['p50_ms']:>7} ms  p99 {row['p99_ms']:>7} ms  "
+                f"session queries {row['session_queries']}")
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
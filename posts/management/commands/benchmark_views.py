@@ -0,0 +1,125 @@
+import json
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Group, Post, UserStats
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(share * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Measures latency percentiles and query counts of the posts '
+            'views against the current database (see seed_data) and '
+            'writes the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--page', type=int, default=1,
+            help='Numbered page to request from the feeds.')
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help='Run with DummyCache to measure uncached rendering.')
+        parser.add_argument(
+            '--output', default='bench_output.json',
+            help='JSON file the results are written to.')
+
+    def targets(self):
+        """The heaviest instance of every view: the busiest group, the most
+        followed author, the most commented post and the user following
+        the most authors."""
+        group = Group.objects.annotate(
+            posts=Count('group_posts')).order_by('-posts').first()
+        author = UserStats.objects.select_related('user').order_by(
+            '-followers_count').first()
+        post = Post.objects.select_related('author').order_by(
+            '-comments_count').first()
+        reader = UserStats.objects.select_related('user').order_by(
+            '-following_count').first()
+        if not all((group, author, post, reader)):
+            return None, None
+        return reader.user, {
+            'index': (reverse('index'), False),
+            'group_posts': (reverse('group_posts', args=[group.slug]), False),
+            'profile': (reverse('profile', args=[author.user.username]),
+                        False),
+            'post_view': (reverse('post_view', args=[
+                post.author.username, post.pk]), False),
+            'follow_index': (reverse('follow_index'), True),
+        }
+
+    def measure(self, client, url, params, options):
+        for _ in range(options['warmup']):
+            client.get(url, params)
+        timings, queries = [], []
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url, params)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} answered {response.status_code}')
+            queries.append(len(captured))
+        return {
+            'url': url,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p90_ms': round(percentile(timings, 0.9), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': statistics.median(queries),
+        }
+
+    def handle(self, *args, **options):
+        reader, targets = self.targets()
+        if targets is None:
+            self.stderr.write('Nothing to measure, run seed_data first.')
+            return
+        anonymous, logged_in = Client(), Client()
+        logged_in.force_login(reader)
+        params = {'page': options['page']} if options['page'] > 1 else {}
+
+        results = {}
+        with ExitStack() as stack:
+            if options['no_cache']:
+                stack.enter_context(override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+                }}))
+            for name, (url, needs_login) in targets.items():
+                client = logged_in if needs_login else anonymous
+                results[name] = self.measure(client, url, params, options)
+                row = results[name]
+                self.stdout.write(
+                    f"{name:<13} p50 {row['p50_ms']:>8} ms  "
+                    f"p90 {row['p90_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  "
+                    f"queries {row['queries']}")
+
+        report = {
+            'created': timezone.now().isoformat(),
+            'database': settings.DATABASES['default']['NAME'],
+            'debug': settings.DEBUG,
+            'posts': Post.objects.count(),
+            'requests': options['requests'],
+            'page': options['page'],
+            'cache': not options['no_cache'],
+            'views': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Results written to {options['output']}"))
@@ -0,0 +1,41 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import generate_for_post
+
+
+def _close_inherited_connections():
+    # Forked workers must not share the parent's SQLite handle.
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Builds the thumbnail variants of every post image in a pool '
+            'of worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of worker processes (default: CPU count).')
+        parser.add_argument(
+            '--chunk-size', type=int, default=20,
+            help='Posts handed to a worker at a time.')
+
+    def handle(self, *args, **options):
+        post_ids = list(
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .values_list('pk', flat=True))
+        connections.close_all()
+        with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                initializer=_close_inherited_connections) as pool:
+            for done, _ in enumerate(
+                    pool.map(generate_for_post, post_ids,
+                             chunksize=options['chunk_size']), start=1):
+                if done % 100 == 0:
+                    self.stdout.write(f'{done}/{len(post_ids)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Built thumbnails for {len(post_ids)} posts.'))
@@ -0,0 +1,46 @@
+import random
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from yatube.db import atomic_retry
+
+
+class Command(BaseCommand):
+    help = ('Deletes expired sessions in small batches with pauses in '
+            'between, so cleanup never holds the SQLite write lock for '
+            'long. Replaces clearsessions in cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Seconds to sleep between batches.')
+        parser.add_argument(
+            '--jitter', type=float, default=0,
+            help='Sleep a random 0..N seconds first, so hosts that share '
+                 'a cron schedule do not prune at the same moment.')
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'):
+            self.stdout.write('Sessions are not stored in the database.')
+            return
+        model = store.get_model_class()
+        time.sleep(random.uniform(0, options['jitter']))
+
+        now = timezone.now()
+        total = 0
+        while True:
+            keys = list(model.objects.filter(expire_date__lt=now).values_list(
+                'session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            deleted, _ = atomic_retry(
+                model.objects.filter(session_key__in=keys).delete)
+            total += deleted
+            time.sleep(options['pause'])
+        self.stdout.write(f'Deleted {total} expired sessions.')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import recount_all
+
+
+class Command(BaseCommand):
+    help = ('Recomputes Post.comments_count and every UserStats row '
+            'from the source tables to repair counter drift.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users, posts = recount_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {users} users and {posts} posts.'))
@@ -0,0 +1,138 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from posts import counters, search, timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'лето море город книга утро кофе дорога друг музыка вечер снег '
+    'поезд река сад кино ветер дом свет осень работа идея путь '
+    'небо лес память звезда сон окно чай письмо история'
+).split()
+
+
+class Command(BaseCommand):
+    help = ('Fills the database with generated users, groups, posts, '
+            'comments and a power-law follow graph for benchmarking.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument(
+            '--follows', type=int, default=30,
+            help='Average number of authors each user follows.')
+        parser.add_argument(
+            '--alpha', type=float, default=1.2,
+            help='Zipf exponent of author popularity: higher values give '
+                 'a few authors most of the followers.')
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.3,
+            help='Share of posts that get an image.')
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def text(self, rng, low, high):
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+    def zipf_weights(self, size, alpha):
+        return [1 / (rank ** alpha) for rank in range(1, size + 1)]
+
+    def make_images(self, rng, amount=8):
+        names = []
+        for number in range(amount):
+            buffer = BytesIO()
+            color = tuple(rng.randrange(256) for _ in range(3))
+            Image.new('RGB', (1600, 900), color).save(buffer, 'JPEG')
+            names.append(default_storage.save(
+                f'posts/seed-{number}.jpg', ContentFile(buffer.getvalue())))
+        return names
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        span = timedelta(days=options['days']).total_seconds()
+
+        password = make_password('seed-password')
+        first_user = User.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        User.objects.bulk_create(
+            (User(username=f'seed_{first_user + number}', password=password,
+                  first_name=rng.choice(WORDS).title())
+             for number in range(options['users'])))
+        users = list(User.objects.filter(
+            username__startswith='seed_').values_list('pk', flat=True))
+        rng.shuffle(users)
+
+        Group.objects.bulk_create(
+            (Group(title=f'Сообщество {number}', slug=f'seed-{number}',
+                   description=self.text(rng, 5, 20))
+             for number in range(options['groups'])),
+            ignore_conflicts=True)
+        groups = list(Group.objects.filter(
+            slug__startswith='seed-').values_list('pk', flat=True))
+
+        # The same Zipf ranking drives who writes and who is followed, so
+        # popular authors are also prolific, as on real networks.
+        weights = self.zipf_weights(len(users), options['alpha'])
+        images = self.make_images(rng) if options['image_ratio'] else []
+        authors = rng.choices(users, weights, k=options['posts'])
+        posts = Post.objects.bulk_create(
+            (Post(author_id=author,
+                  group_id=rng.choice(groups) if groups and rng.random() < 0.5
+                  else None,
+                  text=self.text(rng, 10, 80),
+                  image=rng.choice(images)
+                  if images and rng.random() < options['image_ratio']
+                  else None)
+             for author in authors))
+        # auto_now_add stamps every row with now; spread them out.
+        post_ids = list(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:len(posts)])
+        dated = [Post(pk=pk, pub_date=now - timedelta(
+                     seconds=rng.random() * span)) for pk in post_ids]
+        Post.objects.bulk_update(dated, ['pub_date'], batch_size=500)
+
+        post_weights = self.zipf_weights(len(post_ids), options['alpha'])
+        commented = rng.choices(post_ids, post_weights, k=options['comments'])
+        Comment.objects.bulk_create(
+            (Comment(post_id=post, author_id=rng.choice(users),
+                     text=self.text(rng, 3, 30))
+             for post in commented))
+
+        follows = set()
+        for user in users:
+            amount = min(int(rng.expovariate(1 / options['follows'])),
+                         len(users) - 1)
+            for author in rng.choices(users, weights, k=amount):
+                if author != user:
+                    follows.add((user, author))
+        Follow.objects.bulk_create(
+            (Follow(user_id=user, author_id=author)
+             for user, author in follows),
+            ignore_conflicts=True)
+
+        self.stdout.write('Rebuilding counters, timelines and search...')
+        counters.recount_all()
+        timeline.rebuild()
+        if search.enabled():
+            search.rebuild()
+        if connection.vendor == 'sqlite':
+            # Fresh planner statistics, also read by estimated_count().
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users, {len(groups)} groups, '
+            f'{len(post_ids)} posts, {len(commented)} comments and '
+            f'{len(follows)} follows.'))
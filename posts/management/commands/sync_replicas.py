@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from yatube.db import copy_database
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary database into every read replica in '
+            'DATABASE_REPLICAS (see YATUBE_DB_REPLICAS).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep syncing every this many seconds.')
+
+    def sync(self):
+        for alias in settings.DATABASE_REPLICAS:
+            started = time.perf_counter()
+            copy_database(settings.DATABASES[alias]['NAME'])
+            self.stdout.write(
+                f'{alias}: synced in '
+                f'{(time.perf_counter() - started) * 1000:.0f} ms')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            self.stderr.write('No replicas configured, set YATUBE_DB_REPLICAS.')
+            return
+        self.sync()
+        while options['interval']:
+            time.sleep(options['interval'])
+            self.sync()
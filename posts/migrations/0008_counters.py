@@ -0,0 +1,67 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    UserStats = apps.get_model('posts', 'UserStats')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    def count_of(queryset, field):
+        return Coalesce(Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=models.IntegerField(),
+        ), 0)
+
+    Post.objects.update(comments_count=count_of(Comment.objects.all(), 'post'))
+    users = User.objects.annotate(
+        posts_count=count_of(Post.objects.all(), 'author'),
+        followers_count=count_of(
+            Follow.objects.filter(user__isnull=False), 'author'),
+        following_count=count_of(
+            Follow.objects.filter(author__isnull=False), 'user'),
+    ).values_list(
+        'pk', 'posts_count', 'followers_count', 'following_count')
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk, posts_count=posts, followers_count=followers,
+                   following_count=following)
+         for pk, posts, followers, following in users.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('followers_count', models.PositiveIntegerField(default=0)),
+                ('following_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def dedupe_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = (
+        Follow.objects.filter(user__isnull=False, author__isnull=False)
+        .values('user', 'author')
+        .annotate(rows=Count('id'), keep=Min('id'))
+        .filter(rows__gt=1)
+    )
+    touched = set()
+    for row in duplicates.iterator():
+        Follow.objects.filter(
+            user=row['user'], author=row['author']
+        ).exclude(id=row['keep']).delete()
+        touched.update((row['user'], row['author']))
+
+    for user_id in touched:
+        UserStats.objects.filter(user_id=user_id).update(
+            followers_count=Follow.objects.filter(
+                author_id=user_id, user__isnull=False).count(),
+            following_count=Follow.objects.filter(
+                user_id=user_id, author__isnull=False).count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_follows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    execute = schema_editor.execute
+    execute(
+        'CREATE VIRTUAL TABLE posts_post_fts USING fts5('
+        "text, tokenize='unicode61 remove_diacritics 2')")
+    execute(
+        'CREATE VIRTUAL TABLE posts_user_fts USING fts5('
+        "username, full_name, tokenize='unicode61 remove_diacritics 2')")
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO posts_post_fts (rowid, text) VALUES (%s, %s)',
+            list(Post.objects.values_list('pk', 'text')))
+        cursor.executemany(
+            'INSERT INTO posts_user_fts (rowid, username, full_name) '
+            'VALUES (%s, %s, %s)',
+            [(pk, username, f'{first} {last}'.strip())
+             for pk, username, first, last in User.objects.values_list(
+                 'pk', 'username', 'first_name', 'last_name')])
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_user_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_indexes_unique_follow'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
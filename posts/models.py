@@ -18,6 +18,12 @@ class Follow(models.Model):
         null=True, 
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'),
+        ]
+
     def __str__(self):
         return f'follower - {self.user} following {self.author}.'
 
@@ -31,6 +37,15 @@ class Group(models.Model):
         return f'{self.title}'
 
 
+class PostQuerySet(models.QuerySet):
+
+    def for_feed(self):
+        """Everything post_item.html touches, fetched in the feed query:
+        the author and group are joined in and the comment count is the
+        stored Post.comments_count counter."""
+        return self.select_related('author', 'group')
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField('date published', auto_now_add=True)
@@ -47,6 +62,23 @@ class Post(models.Model):
         blank=True
     )
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Same column order as the feeds' ORDER BY pub_date, id, so
+            # a page is a walk along the index without a sort.
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_date_id_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_id_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.author}: {self.text[:20]}...'
@@ -66,5 +98,54 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField('date created', auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_id_idx'),
+        ]
+
     def __str__(self):
         return f'{self.created}: {self.text}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField('date published')
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_post_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} timeline: {self.post_id}'
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stats',
+        primary_key=True,
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return (f'{self.user}: {self.posts_count} posts, '
+                f'{self.followers_count} followers, '
+                f'{self.following_count} following')
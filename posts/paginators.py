@@ -0,0 +1,233 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import fragments
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# Seconds a feed's total is reused; writes to the feed drop it sooner.
+COUNT_TIMEOUT = 60
+
+# Largest id SQLite can bind; a bigger one in a cursor would overflow.
+MAX_ID = 2 ** 63 - 1
+
+
+def encode_cursor(position, direction=NEXT):
+    """Packs a (datetime, id) position into an opaque url-safe token."""
+    value, pk = position
+    raw = json.dumps([value.isoformat(), pk, direction])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Returns ((datetime, id), direction) or None for a broken token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk, direction = json.loads(raw.decode())
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if (value is None or direction not in (NEXT, PREVIOUS)
+            or not 1 <= pk <= MAX_ID
+            or settings.USE_TZ and timezone.is_naive(value)):
+        return None
+    return (value, pk), direction
+
+
+class CursorPage(Sequence):
+    """One window of a keyset-paginated feed, newest first."""
+
+    number = None
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[-1], NEXT)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[0], PREVIOUS)
+
+
+class CursorPaginator:
+    """
+    Keyset paginator over a (date_field, id) ordering, newest first.
+
+    Every page costs one indexed range query of per_page + 1 rows plus a
+    single EXISTS probe, no matter how deep the page is: there is no
+    COUNT(*) and no OFFSET.
+    """
+
+    def __init__(self, queryset, per_page, date_field='pub_date'):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.date_field = date_field
+
+    def cursor_for(self, obj, direction=NEXT):
+        return encode_cursor(
+            (getattr(obj, self.date_field), obj.pk), direction)
+
+    # (date, id) < (value, pk), spelled with a plain range bound on the
+    # date in front: SQLite turns a bare OR of two ranges into a
+    # MULTI-INDEX OR plus a sort, but seeks the (date, id) index to the
+    # bound and walks it when the OR only filters the rows it reads.
+    def _older(self, position):
+        value, pk = position
+        return Q(**{f'{self.date_field}__lte': value}) & (
+            Q(**{f'{self.date_field}__lt': value}) | Q(pk__lt=pk))
+
+    def _newer(self, position):
+        value, pk = position
+        return Q(**{f'{self.date_field}__gte': value}) & (
+            Q(**{f'{self.date_field}__gt': value}) | Q(pk__gt=pk))
+
+    def _rows(self, position, direction, limit):
+        """Up to limit objects past position: older ones newest first for
+        NEXT, newer ones oldest first for PREVIOUS; from the top without
+        a position."""
+        if direction == NEXT:
+            order = (f'-{self.date_field}', '-pk')
+            queryset = self.queryset if position is None else (
+                self.queryset.filter(self._older(position)))
+        else:
+            order = (self.date_field, 'pk')
+            queryset = self.queryset.filter(self._newer(position))
+        return list(queryset.order_by(*order)[:limit])
+
+    def _exists(self, position, direction):
+        predicate = (self._older if direction == NEXT else self._newer)
+        return self.queryset.filter(predicate(position)).exists()
+
+    def get_page(self, cursor=None):
+        """Returns the page after (or before) cursor; bad cursors fall
+        back to the first page, like Paginator.get_page does."""
+        decoded = decode_cursor(cursor)
+
+        if decoded is None:
+            rows = self._rows(None, NEXT, self.per_page + 1)
+            has_next = len(rows) > self.per_page
+            return CursorPage(rows[:self.per_page], self, has_next, False)
+
+        position, direction = decoded
+        if direction == NEXT:
+            rows = self._rows(position, NEXT, self.per_page + 1)
+            has_next = len(rows) > self.per_page
+            has_previous = self._exists(position, PREVIOUS)
+            return CursorPage(
+                rows[:self.per_page], self, has_next, has_previous)
+
+        rows = self._rows(position, PREVIOUS, self.per_page + 1)
+        has_previous = len(rows) > self.per_page
+        has_next = self._exists(position, NEXT)
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(rows, self, has_next, has_previous)
+
+
+def estimated_count(queryset):
+    """Row count of an unfiltered queryset's table from the statistics of
+    the last ANALYZE, or None when there are none."""
+    if connection.vendor != 'sqlite' or queryset.query.where:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # No sqlite_stat1 table before the first ANALYZE.
+        return None
+    return int(row[0].split()[0]) if row else None
+
+
+def feed_count(scope, queryset):
+    """
+    Total of a feed for the numbered pages, cached under the fragment
+    version of its scope so a write to the feed drops it at once. Tables
+    beyond PAGINATOR_ESTIMATE_THRESHOLD rows are not counted at all but
+    estimated from the ANALYZE statistics.
+    """
+    key = f'feed-count:{scope}:{fragments.version(scope)}'
+    count = cache.get(key)
+    if count is None:
+        count = estimated_count(queryset)
+        threshold = getattr(settings, 'PAGINATOR_ESTIMATE_THRESHOLD', 100000)
+        if count is None or count < threshold:
+            count = queryset.count()
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+def cursor_paginator(feed, per_page, date_field='pub_date'):
+    """A keyset paginator for a queryset, or the one a feed with its own
+    ordering (timeline.Timeline) provides."""
+    if isinstance(feed, QuerySet):
+        return CursorPaginator(feed, per_page, date_field)
+    return feed.cursor_paginator(per_page)
+
+
+def paginate(request, queryset, per_page=10, count_scope=None):
+    """
+    Picks the paginator for a feed view: ?cursor= requests get a keyset
+    page, everything else keeps the numbered ?page= navigation. With a
+    count_scope (see posts.fragments) the numbered paginator takes its
+    total from feed_count() instead of a COUNT(*) per request.
+    """
+    cursor = request.GET.get('cursor')
+    if cursor:
+        paginator = cursor_paginator(queryset, per_page)
+        return paginator, paginator.get_page(cursor)
+    if isinstance(queryset, QuerySet):
+        queryset = queryset.order_by('-pub_date', '-pk')
+    paginator = Paginator(queryset, per_page)
+    if count_scope is not None:
+        # Paginator.count is a cached_property: priming it skips the query.
+        paginator.__dict__['count'] = feed_count(count_scope, queryset)
+    return paginator, paginator.get_page(request.GET.get('page'))
+
+
+def comment_page(request, comments, per_page=20):
+    """The newest comments, or the ones after ?cursor=."""
+    paginator = CursorPaginator(comments, per_page, date_field='created')
+    return paginator.get_page(request.GET.get('cursor'))
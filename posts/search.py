@@ -0,0 +1,144 @@
+"""
+Full-text search over posts and users backed by SQLite FTS5.
+
+posts_post_fts holds the text of every post under the post's id as rowid
+and posts_user_fts the username and full name of every user. Both are
+updated row by row from the model signals in posts.signals, and queries
+are answered from the FTS index ordered by bm25 rank, so search cost
+does not grow with a LIKE scan over the whole table.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import Post, User
+
+POST_TABLE = 'posts_post_fts'
+USER_TABLE = 'posts_user_fts'
+
+# Control characters cannot come from a browser form, so they are safe
+# to mark match boundaries in snippet() before the text is escaped.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Deepest result a search pages to: OFFSET still ranks every row it
+# skips, and an unbounded one can overflow the SQLite bind.
+MAX_OFFSET = 1000
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Turns free user input into a safe FTS5 query: every word must
+    match, the last one as a prefix so results follow the typing."""
+    words = WORD_RE.findall(query or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _highlight(snippet):
+    return (escape(snippet)
+            .replace(MARK_START, '<mark>')
+            .replace(MARK_END, '</mark>'))
+
+
+def index_post(post):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {POST_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {POST_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text])
+
+
+def unindex_post(post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {POST_TABLE} WHERE rowid = %s', [post_id])
+
+
+def index_user(user):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {USER_TABLE} WHERE rowid = %s', [user.pk])
+        cursor.execute(
+            f'INSERT INTO {USER_TABLE} (rowid, username, full_name) '
+            'VALUES (%s, %s, %s)',
+            [user.pk, user.username, user.get_full_name()])
+
+
+def unindex_user(user_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {USER_TABLE} WHERE rowid = %s', [user_id])
+
+
+def rebuild():
+    """Refills both indexes from scratch, e.g. after bulk inserts that
+    bypass the model signals."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {POST_TABLE}')
+        cursor.execute(f'DELETE FROM {USER_TABLE}')
+        cursor.executemany(
+            f'INSERT INTO {POST_TABLE} (rowid, text) VALUES (%s, %s)',
+            list(Post.objects.values_list('pk', 'text').iterator()))
+        cursor.executemany(
+            f'INSERT INTO {USER_TABLE} (rowid, username, full_name) '
+            'VALUES (%s, %s, %s)',
+            [(user.pk, user.username, user.get_full_name())
+             for user in User.objects.only(
+                 'username', 'first_name', 'last_name').iterator()])
+
+
+def matching_post_ids(query):
+    """Subquery of matching post ids, for filtering a Post queryset."""
+    expression = match_expression(query)
+    if expression is None:
+        return RawSQL('SELECT NULL WHERE 0', [])
+    return RawSQL(
+        f'SELECT rowid FROM {POST_TABLE} WHERE {POST_TABLE} MATCH %s',
+        [expression])
+
+
+def search_posts(query, limit=20, offset=0):
+    """Best matching posts first, each with a highlighted .snippet."""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, snippet({POST_TABLE}, 0, %s, %s, %s, 16) '
+            f'FROM {POST_TABLE} WHERE {POST_TABLE} MATCH %s '
+            'ORDER BY rank LIMIT %s OFFSET %s',
+            [MARK_START, MARK_END, '…', expression, limit, offset])
+        rows = cursor.fetchall()
+    posts = Post.objects.for_feed().in_bulk([pk for pk, _ in rows])
+    results = []
+    for pk, snippet in rows:
+        if pk in posts:
+            posts[pk].snippet = _highlight(snippet)
+            results.append(posts[pk])
+    return results
+
+
+def search_users(query, limit=10):
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {USER_TABLE} WHERE {USER_TABLE} MATCH %s '
+            'ORDER BY rank LIMIT %s',
+            [expression, limit])
+        ids = [pk for pk, in cursor.fetchall()]
+    users = User.objects.in_bulk(ids)
+    return [users[pk] for pk in ids if pk in users]
@@ -0,0 +1,159 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, fragments, live, search, timeline, usernames
+from .models import Comment, Follow, Group, Post, User
+
+
+# Counters are registered first: the timeline receivers read UserStats,
+# which must already reflect the write being handled.
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created and instance.user_id and instance.author_id:
+        counters.bump_user(instance.author_id, 'followers_count', 1)
+        counters.bump_user(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    if instance.user_id and instance.author_id:
+        counters.bump_user(instance.author_id, 'followers_count', -1)
+        counters.bump_user(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created and instance.user_id and instance.author_id:
+        timeline.followed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    if instance.user_id and instance.author_id:
+        timeline.unfollowed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def announce_new_post(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: live.publish(instance))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_fragments(sender, instance, **kwargs):
+    fragments.invalidate_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_fragments(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        fragments.invalidate_post(post)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_fragments(sender, instance, **kwargs):
+    if instance.user_id and instance.author_id:
+        fragments.bump(
+            f'user:{instance.user_id}', f'user:{instance.author_id}')
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_fragments(sender, instance, **kwargs):
+    fragments.bump(f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_fragments(sender, instance, update_fields=None,
+                              **kwargs):
+    if update_fields != frozenset({'last_login'}):
+        fragments.bump(f'user:{instance.pk}')
+
+
+@receiver(post_save, sender=Post)
+def index_post_text(sender, instance, **kwargs):
+    if search.enabled():
+        search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post_text(sender, instance, **kwargs):
+    if search.enabled():
+        search.unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def index_user_names(sender, instance, update_fields=None, **kwargs):
+    if update_fields == frozenset({'last_login'}):
+        return
+    if search.enabled():
+        search.index_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def unindex_user_names(sender, instance, **kwargs):
+    if search.enabled():
+        search.unindex_user(instance.pk)
+
+
+@receiver(pre_save, sender=User)
+def remember_old_username(sender, instance, update_fields=None, **kwargs):
+    instance._old_username = None
+    if instance.pk is None or (
+            update_fields is not None and 'username' not in update_fields):
+        return
+    old = User.objects.filter(pk=instance.pk).values_list(
+        'username', flat=True).first()
+    if old != instance.username:
+        instance._old_username = old
+
+
+# Names are forgotten once the write commits: until then other requests
+# still read the old row, and a resolve() among them would cache it again
+# right after an earlier eviction.
+@receiver(post_save, sender=User)
+def forget_usernames(sender, instance, created, update_fields=None,
+                     **kwargs):
+    # The new name may be cached as "no such user".
+    names = {instance.username, getattr(instance, '_old_username', None)}
+    names.discard(None)
+    if created or update_fields is None or 'username' in update_fields:
+        transaction.on_commit(lambda: usernames.forget(*names))
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_username(sender, instance, **kwargs):
+    username = instance.username
+    transaction.on_commit(lambda: usernames.forget(username))
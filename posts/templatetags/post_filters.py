@@ -0,0 +1,52 @@
+from django import template
+
+from posts import fragments
+from posts.paginators import encode_cursor
+
+register = template.Library()
+
+
+@register.filter
+def next_cursor(page):
+    """Cursor that continues a numbered page as a keyset page."""
+    last = page[len(page) - 1]
+    return encode_cursor((last.pub_date, last.pk))
+
+
+@register.filter
+def page_window(page, on_each_side=2):
+    """Page numbers around the current one plus the first and the last,
+    with None where a run of pages is left out."""
+    last = page.paginator.num_pages
+    if last <= 2 * on_each_side + 5:
+        return list(range(1, last + 1))
+    start = max(page.number - on_each_side, 1)
+    end = min(page.number + on_each_side, last)
+    window = list(range(start, end + 1))
+    if start > 3:
+        window = [1, None] + window
+    else:
+        window = list(range(1, start)) + window
+    if end < last - 2:
+        window += [None, last]
+    else:
+        window += list(range(end + 1, last + 1))
+    return window
+
+
+@register.filter
+def fragment_key(post, user):
+    """Cache key part of one post_item.html: the versions of what it shows
+    and whether the viewer sees the author-only edit link."""
+    owner = user.is_authenticated and user.pk == post.author_id
+    versions = fragments.versions(fragments.item_scopes(post))
+    return ':'.join(map(str, [post.pk, *versions, int(owner)]))
+
+
+@register.filter
+def page_version(page):
+    """Cache key part of a whole feed page: the authors and groups its
+    posts show, which the feed's own version does not follow."""
+    scopes = sorted({scope for post in page
+                     for scope in fragments.item_scopes(post)[1:]})
+    return ':'.join(map(str, fragments.versions(scopes)))
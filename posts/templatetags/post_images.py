@@ -0,0 +1,36 @@
+import logging
+
+from django import template
+
+from posts import thumbnails
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+SIZES = '(max-width: 768px) 100vw, 730px'
+
+
+@register.inclusion_tag('picture.html')
+def post_picture(image):
+    """<picture> with AVIF/WebP/JPEG srcsets for a post image; falls back
+    to the original until the variants are built. Nothing is built here:
+    the background pass does it and then drops the cached post."""
+    if not image:
+        return {}
+    try:
+        srcsets = thumbnails.srcsets(image)
+        jpeg = srcsets.pop('image/jpeg', None)
+        if jpeg:
+            src = jpeg.split(', ')[-1].rsplit(' ', 1)[0]
+        else:
+            src = image.url
+    except Exception:
+        logger.exception('Could not render picture for %s', image.name)
+        return {}
+    return {
+        'src': src,
+        'srcset': jpeg,
+        'sources': list(srcsets.items()),
+        'sizes': SIZES,
+    }
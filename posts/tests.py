@@ -1,9 +1,43 @@
+import gzip
+import json
+import os
 import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
 import time
-from django.test import Client, TestCase, override_settings
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import (
+    IntegrityError, OperationalError, connection, connections, transaction)
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.shortcuts import reverse
+from sorl.thumbnail import default as sorl_default
+from sorl.thumbnail.images import ImageFile
+from posts import (
+    follows, fragments, timeline, live, search, thumbnails, usernames, write_queue)
 from posts.forms import PostForm
-from posts.models import Comment, Follow, Group, Post, User
+from posts.models import (
+    Comment, Follow, Group, Post, TimelineEntry, User, UserStats)
+from posts.paginators import CursorPaginator, encode_cursor
+from posts.templatetags import post_filters
+from yatube import db, routers
+from yatube.cache_backends import SQLiteCache
+from yatube.middleware import ReplicaPinMiddleware
+from yatube.staticfiles import PrecompressedStaticFiles
 
 
 class TestFollower(TestCase):
@@ -132,23 +166,76 @@ class TestCache(TestCase):
 
 
     def test_cache_main_page(self):
-        resp1 = self.client.get('', follow=True)
         self.post = Post.objects.create(
             text='Just look at me', author=self.user)
+        resp1 = self.client.get('', follow=True)
+        Post.objects.filter(pk=self.post.pk).update(text='Changed quietly')
 
         resp2 = self.client.get('', follow=True)
-        self.assertNotContains(resp2, self.post.text, status_code=200, 
+        self.assertContains(resp2, 'Just look at me', status_code=200, 
             msg_prefix='Кэш не сработал, страница успела обновиться')
 
-        time.sleep(21)
+        self.client.post(reverse('new_post'), {'text': 'Fresh post'})
         resp3 = self.client.get('', follow=True)
-        self.assertContains(resp3, self.post.text, status_code=200, 
+        self.assertContains(resp3, 'Fresh post', status_code=200, 
             msg_prefix='Новый пост на странице так и не появился')
+
+
+    def test_cache_is_kept_per_page(self):
+        for i in range(15):
+            Post.objects.create(text=f'Post number {i}', author=self.user)
+        resp1 = self.client.get('', {'page': 1})
+        resp2 = self.client.get('', {'page': 2})
+        self.assertContains(resp2, 'Post number 0',
+            msg_prefix='Вторая страница отдана из кэша первой.')
+        self.assertNotContains(resp1, 'Post number 0')
+
+
+    def test_comment_refreshes_cached_post(self):
+        self.post = Post.objects.create(
+            text='Just look at me', author=self.user)
+        self.client.get(reverse('profile', kwargs={
+            'username': self.user.username}))
+        self.client.post(reverse('add_comment', kwargs={
+            'username': self.user.username, 'post_id': self.post.id}),
+            {'text': 'Nice post'})
+        resp = self.client.get(reverse('profile', kwargs={
+            'username': self.user.username}))
+        self.assertContains(resp, '1 комментариев',
+            msg_prefix='После комментария профиль отдан из старого кэша.')
+
+
+    def test_renames_refresh_cached_posts(self):
+        author = User.objects.create_user(username='alice')
+        group = Group.objects.create(title='Old title', slug='group')
+        Post.objects.create(text='Hello', author=author, group=group)
+        Follow.objects.create(user=self.user, author=author)
+        urls = ['/', reverse('group_posts', args=[group.slug]),
+                reverse('follow_index')]
+        for url in urls:
+            self.assertContains(self.client.get(url), 'href="/alice/"')
+
+        author.username = 'alice2'
+        author.save()
+        group.title = 'New title'
+        group.save()
+        for url in urls:
+            resp = self.client.get(url)
+            self.assertContains(resp, 'href="/alice2/"',
+                msg_prefix=f'{url}: кэш ссылается на старое имя автора')
+            self.assertContains(resp, '#New title',
+                msg_prefix=f'{url}: кэш показывает старое название группы')
         
 
 class TestImg(TestCase):
 
     def setUp(self):
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.media_dir.cleanup)
+        self.addCleanup(self.settings_override.disable)
         self.client = Client()
         self.user = User.objects.create_user(
             username='masha_test', 
@@ -322,3 +409,1524 @@ class TestPosts(TestCase):
             f'/{self.user.username}/{self.post.id}', follow=True)
         self.assertContains(resp3, 'отредактировано', status_code=200, 
             msg_prefix='Изменения в посте не отображаются на его странице.')   
+
+
+class TestCursorPagination(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.posts = [
+            Post.objects.create(text=f'Post number {i}', author=self.user)
+            for i in range(25)
+        ]
+
+
+    def test_cursor_pages_walk_whole_feed(self):
+        seen = []
+        resp = self.client.get(reverse('profile', kwargs={
+            'username': self.user.username}))
+        seen += [post.id for post in resp.context['page']]
+        self.assertContains(resp, '?cursor=',
+            msg_prefix='Ссылка на следующую страницу не ведёт на курсор.')
+        next_cursor = post_filters.next_cursor(resp.context['page'])
+        while next_cursor:
+            resp = self.client.get(reverse('profile', kwargs={
+                'username': self.user.username}), {'cursor': next_cursor})
+            seen += [post.id for post in resp.context['page']]
+            next_cursor = resp.context['page'].next_cursor
+
+        expected = [post.id for post in reversed(self.posts)]
+        self.assertEqual(seen, expected,
+            msg='Курсорная пагинация потеряла или повторила посты.')
+
+
+    def test_previous_cursor_returns_previous_page(self):
+        first = self.client.get(reverse('index'), {'cursor': 'broken'})
+        self.assertEqual(len(first.context['page']), 10,
+            msg='Неверный курсор должен отдавать первую страницу.')
+        second = self.client.get(reverse('index'), {
+            'cursor': first.context['page'].next_cursor})
+        back = self.client.get(reverse('index'), {
+            'cursor': second.context['page'].previous_cursor})
+        self.assertEqual(
+            [post.id for post in back.context['page']],
+            [post.id for post in first.context['page']],
+            msg='Ссылка назад не вернула предыдущую страницу.')
+        self.assertFalse(back.context['page'].has_previous())
+
+
+    def test_out_of_range_cursor_returns_first_page(self):
+        first = [post.id for post in
+                 self.client.get(reverse('index')).context['page']]
+        date = self.posts[3].pub_date
+        for position in [(date, 10 ** 30), (date, 0),
+                         (timezone.make_naive(date), self.posts[3].pk)]:
+            cursor = encode_cursor(position)
+            resp = self.client.get(reverse('index'), {'cursor': cursor})
+            self.assertEqual([post.id for post in resp.context['page']],
+                first, msg=f'Курсор {position} не вернул первую страницу.')
+            self.assertEqual(self.client.get(
+                reverse('api_index'), {'cursor': cursor}).status_code, 200)
+
+
+    def test_cursor_page_has_constant_query_count(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        deep_cursor = paginator.cursor_for(self.posts[3])
+        with self.assertNumQueries(2):
+            page = paginator.get_page(deep_cursor)
+        self.assertEqual([post.id for post in page],
+            [post.id for post in reversed(self.posts[:3])],
+            msg='Глубокая страница курсора отдала не те посты.')
+
+
+class TestTimeline(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.author = User.objects.create_user(
+            username='masha_test_2', 
+            password='584645'
+        )
+        self.client.force_login(self.reader)
+        self.old_post = Post.objects.create(
+            text='Written before the follow', author=self.author)
+
+
+    def test_follow_backfills_and_new_posts_fan_out(self):
+        self.client.get(reverse('profile_follow', kwargs={
+            'username': self.author.username}))
+        new_post = Post.objects.create(
+            text='Written after the follow', author=self.author)
+        entries = set(TimelineEntry.objects.filter(
+            user=self.reader).values_list('post', flat=True))
+        self.assertEqual(entries, {self.old_post.id, new_post.id},
+            msg='Посты автора не попали в ленту подписчика.')
+
+        self.client.get(reverse('profile_unfollow', kwargs={
+            'username': self.author.username}))
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists(),
+            msg='После отписки посты автора остались в ленте.')
+
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_heavy_author_is_read_on_demand(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(
+            text='Too many followers to fan out', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=new_post).exists(),
+            msg='Пост популярного автора разослан по лентам.')
+
+        resp = self.client.get(reverse('follow_index'))
+        self.assertContains(resp, new_post.text,
+            msg_prefix='Пост популярного автора не найден в подписках.')
+        self.assertEqual(len(resp.context['page']), 2)
+
+        self.assertFalse(TimelineEntry.objects.exists(),
+            msg='История популярного автора скопирована в ленту.')
+
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_author_back_under_the_limit_is_fanned_out_again(self):
+        other = User.objects.create_user(username='masha_test_3')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists(),
+            msg='У популярного автора остались записи в лентах.')
+        while_heavy = Post.objects.create(
+            text='Written while heavy', author=self.author)
+
+        Follow.objects.filter(user=other).delete()
+        self.assertEqual(set(TimelineEntry.objects.filter(
+            user=self.reader).values_list('post', flat=True)),
+            {self.old_post.id, while_heavy.id},
+            msg='Посты, написанные в статусе популярного автора, потеряны.')
+
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_cursor_pages_merge_entries_and_heavy_authors(self):
+        heavy = User.objects.create_user(username='heavy')
+        fan = User.objects.create_user(username='fan')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=heavy)
+        Follow.objects.create(user=fan, author=heavy)
+        for number in range(12):
+            Post.objects.create(text=f'light {number}', author=self.author)
+            Post.objects.create(text=f'heavy {number}', author=heavy)
+        expected = list(Post.objects.filter(
+            author__in=[self.author, heavy]).order_by(
+                '-pub_date', '-pk').values_list('pk', flat=True))
+
+        feed = timeline.Timeline(self.reader)
+        self.assertEqual(feed.count(), len(expected))
+        self.assertEqual([post.pk for post in feed[10:20]], expected[10:20])
+        seen, cursor = [], None
+        while True:
+            page = feed.cursor_paginator(7).get_page(cursor)
+            seen += [post.pk for post in page]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected,
+            msg='Страницы ленты по курсору пропускают или повторяют посты.')
+        back = feed.cursor_paginator(7).get_page(page.previous_cursor)
+        self.assertEqual([post.pk for post in back], expected[14:21])
+
+
+    def test_timeline_page_walks_the_index(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        feed = timeline.Timeline(self.reader)
+        position = (self.old_post.pub_date, self.old_post.pk)
+        for stream in feed._streams(11, position):
+            plan = stream.explain()
+            self.assertNotIn('TEMP B-TREE', plan, msg=plan)
+        self.assertIn('timeline_user_date_post_idx',
+                      next(feed._streams(11, position)).explain())
+
+
+class TestCounters(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.author = User.objects.create_user(
+            username='masha_test_2', 
+            password='584645'
+        )
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(
+            text='Just look at me', author=self.author)
+
+
+    def test_counters_follow_writes(self):
+        self.client.post(reverse('add_comment', kwargs={
+            'username': self.author.username, 'post_id': self.post.id}),
+            {'text': 'Nice post'})
+        self.client.get(reverse('profile_follow', kwargs={
+            'username': self.author.username}))
+        Post.objects.create(text='Second post', author=self.author)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1,
+            msg='Счётчик комментариев не увеличился.')
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (2, 1),
+            msg='Счётчики автора не совпадают с данными.')
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).following_count, 1)
+
+        self.client.get(reverse('profile_unfollow', kwargs={
+            'username': self.author.username}))
+        self.post.delete()
+        stats.refresh_from_db()
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (1, 0),
+            msg='Счётчики автора не уменьшились после удаления.')
+
+
+    def test_recount_command_repairs_drift(self):
+        Comment.objects.create(post=self.post, author=self.user, text='Hi')
+        Post.objects.filter(pk=self.post.pk).update(comments_count=42)
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+
+        call_command('recount_counters', stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).posts_count, 0)
+
+
+class TestIndexes(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.group = Group.objects.create(title='Pretty Group', slug='pretty')
+        self.post = Post.objects.create(
+            text='Just look at me', author=self.user, group=self.group)
+
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan,
+            msg=f'Запрос не использует индекс {index_name}: {plan}')
+
+
+    def test_feeds_use_composite_indexes(self):
+        self.assertUsesIndex(
+            Post.objects.order_by('-pub_date', '-pk')[:10],
+            'post_date_id_idx')
+        self.assertUsesIndex(
+            self.user.author_posts.order_by('-pub_date', '-pk')[:10],
+            'post_author_date_id_idx')
+        self.assertUsesIndex(
+            self.group.group_posts.order_by('-pub_date', '-pk')[:10],
+            'post_group_date_id_idx')
+        self.assertUsesIndex(
+            self.post.post_comments.order_by('-created', '-pk')[:10],
+            'comment_post_created_id_idx')
+
+
+    def test_cursor_pages_walk_the_index_without_sorting(self):
+        # The planner only picks the bad plans once it has statistics,
+        # and needs a realistic spread of authors and groups for them.
+        User.objects.bulk_create(
+            User(username=f'author{number}') for number in range(50))
+        authors = list(User.objects.all())
+        groups = [self.group] + [
+            Group.objects.create(title=f'Группа {number}', slug=f'g{number}')
+            for number in range(4)]
+        Post.objects.bulk_create(
+            Post(text='Текст', author=authors[number % len(authors)],
+                 group=groups[number % len(groups)])
+            for number in range(500))
+        Comment.objects.bulk_create(
+            Comment(text='Комментарий', author=authors[number % 7],
+                    post=self.post)
+            for number in range(50))
+        fragments.bump('index')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        position = (self.post.pub_date, self.post.pk)
+        feeds = [
+            (Post.objects.for_feed(), 'pub_date'),
+            (self.user.author_posts.for_feed(), 'pub_date'),
+            (self.group.group_posts.for_feed(), 'pub_date'),
+            (self.post.post_comments.select_related('author'), 'created'),
+        ]
+        for queryset, date_field in feeds:
+            paginator = CursorPaginator(queryset, 10, date_field)
+            newest_first = (f'-{date_field}', '-pk')
+            for query in (
+                    queryset.filter(paginator._older(position))
+                    .order_by(*newest_first)[:11],
+                    queryset.filter(paginator._newer(position))
+                    .order_by(*[field.lstrip('-')
+                                for field in newest_first])[:11]):
+                plan = query.explain()
+                self.assertNotIn('TEMP B-TREE', plan,
+                                 msg=f'Страница по курсору сортируется: {plan}')
+                self.assertNotIn('MULTI-INDEX', plan, msg=plan)
+
+
+    def test_follow_lookup_uses_unique_index(self):
+        # SQLite backs UniqueConstraint with an anonymous autoindex.
+        self.assertUsesIndex(
+            Follow.objects.filter(user=self.user, author=self.user),
+            'INDEX sqlite_autoindex_posts_follow_1 (user_id=? AND author_id=?)')
+
+
+    def test_follow_is_unique(self):
+        author = User.objects.create_user(username='masha_test_2')
+        Follow.objects.create(user=self.user, author=author)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Follow.objects.create(user=self.user, author=author)
+
+
+class TestFeedQueries(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.group = Group.objects.create(title='Pretty Group', slug='pretty')
+
+
+    def add_posts(self, amount):
+        for i in range(amount):
+            post = Post.objects.create(
+                text=f'Post number {i}', author=self.user, group=self.group)
+            Comment.objects.create(post=post, author=self.user, text='Hi')
+
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+        }})
+    def test_feed_query_count_does_not_grow_with_page_size(self):
+        urls = [
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+        ]
+        self.add_posts(2)
+        small = [self.count_queries(url) for url in urls]
+        self.add_posts(8)
+        full = [self.count_queries(url) for url in urls]
+        self.assertEqual(small, full,
+            msg='Число запросов растёт вместе с числом постов на странице.')
+
+
+class TestSharedCache(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.tmp_dir.name, 'cache.sqlite3')
+        # Two backends on one file stand in for two worker processes.
+        self.worker_1 = SQLiteCache(self.location, {})
+        self.worker_2 = SQLiteCache(
+            self.location, {'OPTIONS': {'MAX_ENTRIES': 3}})
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_workers_see_each_others_writes(self):
+        self.worker_1.set('feed', ['post 1', 'post 2'])
+        self.assertEqual(self.worker_2.get('feed'), ['post 1', 'post 2'])
+
+        self.worker_2.delete('feed')
+        self.assertIsNone(self.worker_1.get('feed'),
+            msg='Удаление ключа не увидел второй процесс.')
+
+        self.assertTrue(self.worker_1.add('version', 1))
+        self.assertFalse(self.worker_2.add('version', 5))
+        self.worker_2.incr('version')
+        self.assertEqual(self.worker_1.incr('version'), 3,
+            msg='Счётчик версий разошёлся между процессами.')
+
+
+    def test_expired_keys_are_not_returned(self):
+        self.worker_1.set('short', 'value', timeout=0)
+        self.assertIsNone(self.worker_2.get('short'))
+        self.assertTrue(self.worker_2.add('short', 'again'))
+        with self.assertRaises(ValueError):
+            self.worker_1.incr('missing')
+
+
+    def test_least_recently_used_key_is_evicted(self):
+        self.worker_2.set('a', 1)
+        self.worker_2.set('b', 2)
+        self.worker_2.set('c', 3)
+        with mock.patch('yatube.cache_backends.time.time',
+                        return_value=time.time() + 10):
+            self.assertEqual(self.worker_2.get('a'), 1)
+            self.worker_2.set('d', 4)
+        self.assertEqual(
+            [self.worker_1.has_key(key) for key in 'abcd'],
+            [True, False, True, True],
+            msg='Из кэша вытеснен не самый давно использованный ключ.')
+
+
+    def test_writes_count_rows_only_every_cull_every_writes(self):
+        cache = SQLiteCache(self.location, {'OPTIONS': {
+            'MAX_ENTRIES': 10000}})
+        statements = []
+        cache._db.set_trace_callback(statements.append)
+        for number in range(99):
+            cache.set(f'key{number}', number)
+        self.assertFalse(any('COUNT' in sql for sql in statements),
+                         msg='Запись в кэш пересчитывает все строки')
+        cache.set('key99', 99)
+        self.assertTrue(any('COUNT' in sql for sql in statements),
+                        msg='Размер кэша не проверяется вовсе')
+
+
+class TestThumbnails(TestCase):
+
+    def setUp(self):
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_dir.name)
+        self.settings_override.enable()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.client.force_login(self.user)
+
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_dir.cleanup()
+
+
+    def make_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buffer, 'JPEG')
+        return SimpleUploadedFile(
+            'red.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+    def test_new_post_schedules_thumbnails(self):
+        with mock.patch('posts.thumbnails.transaction.on_commit',
+                        side_effect=lambda callback: callback()), \
+                mock.patch('posts.thumbnails.executor') as executor:
+            self.client.post(reverse('new_post'), {
+                'text': 'With a picture', 'image': self.make_image()})
+        post = Post.objects.get(text='With a picture')
+        executor.return_value.submit.assert_called_once_with(
+            thumbnails.generate_for_post, post.pk)
+
+
+    def test_generate_for_post_builds_template_variants(self):
+        post = Post.objects.create(
+            text='With a picture', author=self.user, image=self.make_image())
+        thumbnails.generate_for_post(post.pk)
+        built = sorl_default.kvstore._get(
+            ImageFile(post.image).key, identity='thumbnails')
+        self.assertEqual(len(built), len(thumbnails.VARIANTS),
+            msg='Миниатюры поста не были построены заранее.')
+
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+        }})
+    def test_post_page_serves_responsive_picture(self):
+        post = Post.objects.create(
+            text='With a picture', author=self.user, image=self.make_image())
+        thumbnails.generate_for_post(post.pk)
+        resp = self.client.get(reverse('post_view', kwargs={
+            'username': self.user.username, 'post_id': post.id}))
+        self.assertContains(resp, '<source type="image/webp"',
+            msg_prefix='На странице поста нет WebP-варианта картинки.')
+        for width in thumbnails.WIDTHS:
+            self.assertContains(resp, f'-{width}.jpg {width}w')
+
+
+    def test_pages_build_nothing_and_refresh_once_variants_exist(self):
+        post = Post.objects.create(
+            text='With a picture', author=self.user, image=self.make_image())
+        resp = self.client.get(reverse('index'))
+        self.assertContains(resp, post.image.url)
+        self.assertEqual(os.listdir(self.media_dir.name), ['posts'],
+            msg='Страница построила миниатюру в запросе.')
+
+        thumbnails.generate_for_post(post.pk)
+        self.assertContains(self.client.get(reverse('index')),
+            '<source type="image/webp"',
+            msg_prefix='Кэш страницы не сброшен после построения вариантов.')
+
+
+class TestSearch(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645',
+            first_name='Мария',
+        )
+        self.post = Post.objects.create(
+            text='Рецепт яблочного пирога <b>с корицей</b>', author=self.user)
+        Post.objects.create(text='Совсем другая запись', author=self.user)
+
+
+    def test_search_page_finds_posts_and_users(self):
+        resp = self.client.get(reverse('search'), {'q': 'пирог'})
+        self.assertEqual(
+            [post.id for post in resp.context['posts']], [self.post.id],
+            msg='Поиск не нашёл пост по слову из текста.')
+        self.assertContains(resp, '<mark>пирога</mark>')
+        self.assertNotContains(resp, '<b>с корицей</b>',
+            msg_prefix='Текст поста в сниппете не экранирован.')
+
+        resp = self.client.get(reverse('search'), {'q': 'мари'})
+        self.assertEqual(list(resp.context['users']), [self.user],
+            msg='Поиск не нашёл автора по имени.')
+
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.text = 'Теперь про вишнёвый штрудель'
+        self.post.save()
+        self.assertEqual(search.search_posts('пирог'), [])
+        self.assertEqual(search.search_posts('штрудель'), [self.post])
+        self.post.delete()
+        self.assertEqual(search.search_posts('штрудель'), [])
+
+
+    def test_json_endpoint(self):
+        resp = self.client.get(reverse('search_json'), {'q': 'корицей'})
+        data = resp.json()
+        self.assertEqual([post['id'] for post in data['posts']],
+            [self.post.id])
+        self.assertIn('<mark>корицей</mark>', data['posts'][0]['snippet'])
+        resp = self.client.get(reverse('search_json'), {'q': 'x',
+            'limit': 'many'})
+        self.assertEqual(resp.status_code, 400)
+        for offset in (search.MAX_OFFSET + 1, 10 ** 20):
+            resp = self.client.get(reverse('search_json'), {'q': 'a',
+                'offset': offset})
+            self.assertEqual(resp.status_code, 400,
+                msg=f'Смещение {offset} не отклонено.')
+        resp = self.client.get(reverse('search_json'), {'q': 'корицей',
+            'offset': search.MAX_OFFSET})
+        self.assertEqual(resp.json()['posts'], [])
+
+
+    def test_admin_search_uses_index(self):
+        admin_user = User.objects.create_superuser(
+            'admin', 'admin@example.com', '584645')
+        self.client.force_login(admin_user)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/admin/posts/post/', {'q': 'пирог'})
+        self.assertContains(resp, f'/admin/posts/post/{self.post.id}/')
+        self.assertTrue(
+            any('posts_post_fts' in query['sql'] for query in queries),
+            msg='Поиск в админке не использует полнотекстовый индекс.')
+
+
+class TestBenchmarkCommands(TestCase):
+
+    def test_seed_and_benchmark(self):
+        call_command('seed_data', users=30, groups=3, posts=60, comments=40,
+                     image_ratio=0, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 40)
+        busiest = Post.objects.order_by('-comments_count').first()
+        self.assertEqual(busiest.comments_count,
+            busiest.post_comments.count(),
+            msg='После генерации данных счётчики не пересчитаны.')
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=follow.user).count(),
+            Post.objects.filter(author__following__user=follow.user).count(),
+            msg='После генерации данных ленты подписок не заполнены.')
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark_views', requests=2, warmup=0,
+                         output=output.name, stdout=StringIO())
+            report = json.load(output)
+        self.assertEqual(set(report['views']), {
+            'index', 'group_posts', 'profile', 'post_view', 'follow_index'})
+        self.assertIn('p99_ms', report['views']['index'])
+
+
+class TestServerTiming(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        Post.objects.create(text='Just look at me', author=self.user)
+
+
+    def test_header_reports_queries_templates_and_cache(self):
+        with self.assertLogs('yatube.performance', 'INFO') as logs:
+            resp = Client().get(reverse('profile', kwargs={
+                'username': self.user.username}))
+        timing = resp['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertRegex(timing, r'cache;desc="\d+ hits, [1-9]\d* misses"')
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['path'], f'/{self.user.username}/')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['db_queries'], 0)
+
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_instrumented(self):
+        resp = Client().get(reverse('index'))
+        self.assertFalse(resp.has_header('Server-Timing'))
+
+
+class TestApi(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.group = Group.objects.create(
+            title='Test group', slug='test_group', description='Group')
+        for num in range(12):
+            Post.objects.create(
+                text=f'Post {num}', author=self.user, group=self.group)
+        self.post = Post.objects.filter(author=self.user).latest('pub_date')
+        Comment.objects.create(
+            text='Nice post', author=self.user, post=self.post)
+
+
+    def test_feeds_are_paginated_by_cursor(self):
+        for url in (reverse('api_index'),
+                    reverse('api_group', args=[self.group.slug]),
+                    reverse('api_profile', args=[self.user.username])):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200, msg=url)
+            data = resp.json()
+            self.assertEqual(len(data['results']), 10, msg='Неверный размер страницы')
+            self.assertIsNone(data['previous'])
+
+            resp = self.client.get(url, {'cursor': data['next']})
+            data = resp.json()
+            self.assertEqual(len(data['results']), 2, msg='Вторая страница неполная')
+            self.assertIsNone(data['next'])
+
+
+    def test_fields_selection(self):
+        resp = self.client.get(reverse('api_index'), {'fields': 'id,author'})
+        self.assertEqual(
+            resp.json()['results'][0],
+            {'id': self.post.pk, 'author': self.user.username})
+        resp = self.client.get(reverse('api_index'), {'fields': 'password'})
+        self.assertEqual(resp.status_code, 400)
+
+
+    def test_not_modified_until_new_post(self):
+        url = reverse('api_index')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304, msg='ETag не совпал')
+
+        Post.objects.create(text='Fresh post', author=self.user)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200, msg='ETag не сменился после новой записи')
+
+
+    def test_post_detail_with_comments(self):
+        url = reverse('api_post', args=[self.post.pk])
+        resp = self.client.get(url)
+        data = resp.json()
+        self.assertEqual(data['comments_count'], 1)
+        self.assertEqual(data['comments']['results'][0]['text'], 'Nice post')
+        etag = resp['ETag']
+
+        Comment.objects.create(text='Second', author=self.user, post=self.post)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(resp.json()['comments']['results']), 2)
+        self.assertEqual(
+            self.client.get(reverse('api_post', args=[10 ** 6])).status_code, 404)
+
+
+    def test_follow_feed_requires_login(self):
+        self.assertEqual(self.client.get(reverse('api_follow')).status_code, 401)
+        reader = User.objects.create_user(username='reader', password='584645')
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        resp = self.client.get(reverse('api_follow'))
+        self.assertEqual(len(resp.json()['results']), 10)
+        self.assertIn('Cookie', resp['Vary'])
+
+
+class TestConditionalGet(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.reader = User.objects.create_user(
+            username='reader', password='584645')
+        self.group = Group.objects.create(
+            title='Test group', slug='test_group', description='Group')
+        self.post = Post.objects.create(
+            text='Just look at me', author=self.user, group=self.group)
+        self.urls = [
+            reverse('profile', args=[self.user.username]),
+            reverse('post_view', args=[self.user.username, self.post.pk]),
+            reverse('group_posts', args=[self.group.slug]),
+        ]
+
+
+    def etags(self):
+        return {url: self.client.get(url)['ETag'] for url in self.urls}
+
+
+    def assertChanged(self, etags, urls, msg):
+        for url in urls:
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(resp.status_code, 200, msg=f'{msg}: {url}')
+
+
+    def test_revisit_is_not_modified(self):
+        for url, etag in self.etags().items():
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 304, msg=url)
+            self.assertEqual(resp.templates, [], msg='Шаблон отрисован для 304')
+
+
+    def test_writes_change_the_etag(self):
+        etags = self.etags()
+        Comment.objects.create(text='Hi', author=self.reader, post=self.post)
+        self.assertChanged(etags, self.urls, 'Комментарий не сменил ETag')
+
+        etags = self.etags()
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertChanged(etags, self.urls[:2], 'Подписка не сменила ETag')
+
+        etags = self.etags()
+        self.post.text = 'Edited'
+        self.post.save()
+        self.assertChanged(etags, self.urls, 'Правка не сменила ETag')
+
+
+    def test_etag_depends_on_viewer(self):
+        etags = self.etags()
+        self.client.force_login(self.reader)
+        self.assertChanged(etags, self.urls, 'ETag общий для разных пользователей')
+
+
+    def test_etag_changes_with_a_new_login(self):
+        client = Client(enforce_csrf_checks=True)
+
+        def log_in():
+            client.get(reverse('login'))
+            client.post(reverse('login'), {
+                'username': 'reader', 'password': '584645',
+                'csrfmiddlewaretoken': client.cookies['csrftoken'].value})
+
+        def page_token(resp):
+            return re.search(
+                r'name="csrfmiddlewaretoken" value="([^"]+)"',
+                resp.content.decode()).group(1)
+
+        url = self.urls[1]
+        log_in()
+        etag = client.get(url)['ETag']
+        client.get(reverse('logout'))
+        log_in()
+        resp = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200,
+            msg='Страница со старым CSRF-токеном признана свежей')
+        resp = client.post(
+            reverse('add_comment', args=[self.user.username, self.post.pk]),
+            {'text': 'Hi', 'csrfmiddlewaretoken': page_token(resp)})
+        self.assertEqual(resp.status_code, 302)
+
+
+class TestSQLiteProfile(TestCase):
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1234})
+    def test_pragmas_are_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            (default,) = cursor.fetchone()
+            db.apply_pragmas(sender=None, connection=connection)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone(), (-1234,))
+            cursor.execute(f'PRAGMA cache_size = {default}')
+
+
+    @override_settings(SQLITE_LOCK_RETRIES=2, SQLITE_LOCK_RETRY_DELAY=0)
+    def test_locked_writes_are_retried(self):
+        locked = OperationalError('database is locked')
+        # The test case transaction would otherwise leave retries to it.
+        with mock.patch('yatube.db.connection', in_atomic_block=False):
+            write = mock.Mock(side_effect=[locked, locked, 'saved'])
+            self.assertEqual(db.atomic_retry(write), 'saved')
+            self.assertEqual(write.call_count, 3, msg='Запись не повторена')
+
+            write = mock.Mock(side_effect=locked)
+            with self.assertRaises(OperationalError):
+                db.atomic_retry(write)
+            self.assertEqual(write.call_count, 3, msg='Повторы не ограничены')
+
+            write = mock.Mock(side_effect=OperationalError('no such table'))
+            with self.assertRaises(OperationalError):
+                db.atomic_retry(write)
+            self.assertEqual(write.call_count, 1, msg='Повтор не при блокировке')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class TestReplicaRouting(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.post = Post.objects.create(text='Just look at me', author=self.user)
+        self.router = routers.ReplicaRouter()
+        routers.begin()
+
+
+    def tearDown(self):
+        routers.begin()
+
+
+    def test_feed_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), 'replica1')
+            self.assertEqual(self.router.db_for_write(Post), 'default')
+            self.assertEqual(
+                self.router.db_for_read(Post), 'default',
+                msg='После записи чтение ушло на реплику')
+        with override_settings(DATABASE_REPLICAS=[]), routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+
+    def test_own_write_pins_client_to_primary(self):
+        self.client.force_login(self.user)
+        resp = self.client.post(
+            reverse('add_comment', args=[self.user.username, self.post.pk]),
+            {'text': 'Hi'})
+        self.assertIn(ReplicaPinMiddleware.COOKIE, resp.cookies)
+
+        routers.begin(pinned=True)
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2', 'replica3'])
+    def test_request_reads_one_replica(self):
+        with routers.replica_reads():
+            aliases = {self.router.db_for_read(Post) for _ in range(30)}
+        self.assertEqual(len(aliases), 1,
+            msg='Чтения одного запроса разошлись по разным репликам')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class TestLaggingReplica(TransactionTestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        connections.databases['replica1'] = dict(
+            connections.databases['default'],
+            NAME=os.path.join(self.folder.name, 'replica.sqlite3'))
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.post = Post.objects.create(text='Old text', author=self.user)
+        self.url = reverse('profile', args=[self.user.username])
+        db.copy_database(connections.databases['replica1']['NAME'])
+
+
+    def tearDown(self):
+        connections['replica1'].close()
+        del connections.databases['replica1']
+        if hasattr(connections._connections, 'replica1'):
+            delattr(connections._connections, 'replica1')
+        self.folder.cleanup()
+
+
+    def test_lagging_replica_does_not_poison_shared_caches(self):
+        self.post.text = 'New text'
+        self.post.save()
+
+        stale = self.client.get(self.url)
+        self.assertContains(stale, 'Old text')
+
+        self.client.cookies[ReplicaPinMiddleware.COOKIE] = '1'
+        fresh = self.client.get(self.url)
+        self.assertContains(fresh, 'New text',
+            msg_prefix='Основная база отдала фрагмент, собранный на реплике')
+        self.assertNotEqual(fresh['ETag'], stale['ETag'],
+            msg='ETag ответа с реплики совпал с ETag основной базы')
+        self.assertEqual(self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=stale['ETag']).status_code, 200)
+
+        del self.client.cookies[ReplicaPinMiddleware.COOKIE]
+        db.copy_database(connections.databases['replica1']['NAME'])
+        self.assertContains(self.client.get(self.url), 'New text',
+            msg_prefix='После синхронизации реплика отдаёт старый фрагмент')
+
+
+class TestReplicaSync(TransactionTestCase):
+
+    def test_copy_database(self):
+        user = User.objects.create_user(username='masha_test', password='584645')
+        Post.objects.create(text='Just look at me', author=user)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'replica.sqlite3')
+            db.copy_database(path)
+            copy = sqlite3.connect(path)
+            try:
+                (count,) = copy.execute(
+                    'SELECT COUNT(*) FROM posts_post').fetchone()
+            finally:
+                copy.close()
+        self.assertEqual(count, 1, msg='Реплика не совпадает с основной базой')
+
+
+class TestPageWindow(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Post {num}', author=self.user) for num in range(200))
+        # bulk_create() sends no signals to drop cached totals.
+        fragments.bump('index', f'profile:{self.user.pk}')
+
+
+    def test_page_links_are_elided(self):
+        resp = self.client.get(reverse('index'), {'page': 10})
+        self.assertEqual(
+            post_filters.page_window(resp.context['page']),
+            [1, None, 8, 9, 10, 11, 12, None, 20])
+        self.assertContains(resp, '?page=20')
+        self.assertNotContains(resp, '?page=15"')
+        self.assertContains(resp, '&hellip;', count=2)
+
+
+    def test_count_is_cached_until_a_write(self):
+        url = reverse('profile', args=[self.user.username])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            resp = self.client.get(url, {'page': 2})
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in captured),
+            msg='Число записей пересчитано без изменений')
+        self.assertEqual(resp.context['paginator'].count, 200)
+
+        Post.objects.create(text='One more', author=self.user)
+        resp = self.client.get(url)
+        self.assertEqual(resp.context['paginator'].count, 201)
+
+
+    @override_settings(PAGINATOR_ESTIMATE_THRESHOLD=100)
+    def test_large_tables_use_estimates(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute(
+                "UPDATE sqlite_stat1 SET stat = '5000 1' "
+                "WHERE tbl = 'posts_post'")
+        self.assertEqual(
+            self.client.get(reverse('index')).context['paginator'].count, 5000)
+
+
+class TestCommentPages(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.post = Post.objects.create(text='Viral post', author=self.user)
+        readers = User.objects.bulk_create(
+            User(username=f'reader_{num}') for num in range(30))
+        readers = User.objects.filter(username__startswith='reader_')
+        Comment.objects.bulk_create(
+            Comment(text=f'Comment {num}', author=reader, post=self.post)
+            for num, reader in enumerate(readers))
+        self.url = reverse('post_view', args=[self.user.username, self.post.pk])
+
+
+    def test_comments_are_paginated(self):
+        resp = self.client.get(self.url)
+        comments = resp.context['comment_page']
+        self.assertEqual(len(comments), 20, msg='Комментарии не разбиты на страницы')
+        self.assertTrue(comments.has_next())
+        self.assertContains(resp, 'js-more-comments')
+
+
+    def test_comment_authors_are_joined(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(self.url)
+        author_queries = [
+            query for query in captured
+            if query['sql'].startswith('SELECT') and 'FROM "auth_user"' in query['sql']
+            and '"posts_comment"' not in query['sql']]
+        self.assertLess(len(author_queries), 5, msg='Авторы комментариев загружаются по одному')
+
+
+    def test_load_more_returns_fragment(self):
+        cursor = self.client.get(self.url).context['comment_page'].next_cursor
+        resp = self.client.get(
+            reverse('post_comments', args=[self.user.username, self.post.pk]),
+            {'cursor': cursor})
+        self.assertTemplateUsed(resp, 'comment_list.html')
+        self.assertTemplateNotUsed(resp, 'base.html')
+        self.assertEqual(len(resp.context['comment_page']), 10)
+        self.assertNotContains(resp, 'js-more-comments')
+
+
+@override_settings(
+    LIVE_FEED='stream', LIVE_POLL_SECONDS=0.2, LIVE_STREAM_SECONDS=0.5)
+class TestLiveFeed(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.group = Group.objects.create(
+            title='Test group', slug='test_group', description='Group')
+        self.old = Post.objects.create(text='Old post', author=self.user)
+        # on_commit() callbacks never run inside a TestCase.
+        live.publish(self.old)
+        self.url = reverse('live_posts')
+
+
+    def test_long_poll_returns_newer_posts(self):
+        new = Post.objects.create(
+            text='Fresh post', author=self.user, group=self.group)
+        live.publish(new)
+        resp = self.client.get(self.url, {'after': self.old.pk})
+        data = resp.json()
+        self.assertEqual([post['id'] for post in data['posts']], [new.pk])
+        self.assertIn('Fresh post', data['posts'][0]['html'])
+        self.assertEqual(data['cursor'], new.pk)
+
+        resp = self.client.get(
+            self.url, {'feed': 'group', 'group': self.group.slug, 'after': 0})
+        self.assertEqual([post['id'] for post in resp.json()['posts']], [new.pk])
+
+
+    def test_long_poll_times_out_without_news(self):
+        started = time.monotonic()
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url, {'after': self.old.pk})
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(resp.json(), {'posts': [], 'cursor': self.old.pk})
+
+
+    def test_event_stream(self):
+        new = Post.objects.create(text='Fresh post', author=self.user)
+        live.publish(new)
+        resp = self.client.get(
+            self.url, HTTP_ACCEPT='text/event-stream',
+            HTTP_LAST_EVENT_ID=str(self.old.pk))
+        self.assertEqual(resp['Content-Type'], 'text/event-stream')
+        body = b''.join(resp.streaming_content).decode()
+        self.assertIn(f'id: {new.pk}\nevent: post\ndata: ', body)
+        self.assertNotIn(f'id: {self.old.pk}\n', body)
+
+
+    def test_follow_feed(self):
+        self.assertEqual(
+            self.client.get(self.url, {'feed': 'follow'}).status_code, 401)
+        reader = User.objects.create_user(username='reader', password='584645')
+        other = User.objects.create_user(username='other', password='584645')
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        followed = Post.objects.create(text='Followed', author=self.user)
+        stranger = Post.objects.create(text='Stranger', author=other)
+        live.publish(stranger)
+        data = self.client.get(
+            self.url, {'feed': 'follow', 'after': self.old.pk}).json()
+        self.assertEqual([post['id'] for post in data['posts']], [followed.pk])
+        self.assertEqual(data['cursor'], stranger.pk)
+
+
+    @override_settings(LIVE_FEED='off')
+    def test_live_feed_off(self):
+        self.assertNotContains(self.client.get(reverse('index')), 'live-posts')
+        self.assertEqual(self.client.get(self.url).status_code, 404,
+            msg='Выключенная живая лента отвечает')
+
+
+    @override_settings(LIVE_FEED='poll', LIVE_POLL_SECONDS=30)
+    def test_short_poll_answers_at_once(self):
+        self.assertContains(self.client.get(reverse('index')), 'live-posts')
+        started = time.monotonic()
+        resp = self.client.get(
+            self.url, {'after': self.old.pk}, HTTP_ACCEPT='text/event-stream')
+        self.assertLess(time.monotonic() - started, 5,
+            msg='Короткий опрос ждёт новых постов')
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertEqual(resp.json()['cursor'], self.old.pk)
+
+
+class TestWriteBatch(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.post = Post.objects.create(text='Viral post', author=self.user)
+
+
+    def test_batch_updates_counters_and_fragments(self):
+        version = fragments.version(f'post:{self.post.pk}')
+        write_queue.write_batch(
+            [Comment(text=f'Comment {num}', author=self.user, post=self.post)
+             for num in range(3)]
+            + [Post(text='Queued post', author=self.user)])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 3)
+        self.assertNotEqual(fragments.version(f'post:{self.post.pk}'), version)
+        self.assertEqual(self.user.stats.posts_count, 2)
+
+
+@override_settings(WRITE_BEHIND=True, WRITE_QUEUE_MAX_DELAY=0.2)
+class TestWriteBehind(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='masha_test', 
+            password='584645'
+        )
+        self.post = Post.objects.create(text='Viral post', author=self.user)
+
+
+    def test_concurrent_comments_share_a_transaction(self):
+        def comment(num):
+            write_queue.create(
+                Comment(text=f'Comment {num}', author=self.user, post=self.post))
+
+        with mock.patch(
+                'posts.write_queue.atomic_retry',
+                wraps=write_queue.atomic_retry) as transactions:
+            threads = [threading.Thread(target=comment, args=[num])
+                       for num in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 5)
+        self.assertLess(transactions.call_count, 5, msg='Комментарии не объединены')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 5)
+
+
+    def test_redirect_shows_own_comment(self):
+        client = Client()
+        client.force_login(self.user)
+        resp = client.post(
+            reverse('add_comment', args=[self.user.username, self.post.pk]),
+            {'text': 'My own comment'}, follow=True)
+        self.assertContains(resp, 'My own comment')
+
+
+class TestStaticPipeline(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        source = os.path.join(self.folder.name, 'source')
+        self.root = os.path.join(self.folder.name, 'static')
+        os.makedirs(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'site.css'), 'w') as css:
+            css.write('body { color: #333; }\n' * 200)
+        with override_settings(
+                STATIC_ROOT=self.root, STATICFILES_DIRS=[source],
+                STATICFILES_FINDERS=[
+                    'django.contrib.staticfiles.finders.FileSystemFinder'],
+                STATICFILES_STORAGE='yatube.staticfiles.'
+                                    'CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root, 'staticfiles.json')) as manifest:
+            self.hashed = json.load(manifest)['paths']['css/site.css']
+        self.app = PrecompressedStaticFiles(
+            mock.Mock(return_value=[b'django']), self.root, '/static/')
+
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+
+    def get(self, path, accept_encoding=''):
+        start_response = mock.Mock()
+        body = b''.join(self.app({
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path,
+            'HTTP_ACCEPT_ENCODING': accept_encoding,
+        }, start_response))
+        status, headers = start_response.call_args[0]
+        return body, dict(headers)
+
+
+    def test_collectstatic_writes_hashed_gzip_copies(self):
+        self.assertRegex(self.hashed, r'^css/site\.[0-9a-f]{12}\.css$')
+        self.assertTrue(os.path.exists(os.path.join(self.root, self.hashed + '.gz')))
+
+
+    def test_hashed_files_are_immutable_and_negotiated(self):
+        body, headers = self.get(f'/static/{self.hashed}', 'gzip, deflate')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', headers['Cache-Control'])
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(body), b'body { color: #333; }\n' * 200)
+
+        body, headers = self.get(f'/static/{self.hashed}', 'gzip;q=0')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(int(headers['Content-Length']), len(body))
+
+        body, headers = self.get('/static/css/site.css', 'gzip')
+        self.assertNotIn('immutable', headers['Cache-Control'])
+
+
+    def test_other_paths_reach_django(self):
+        self.assertEqual(self.app({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'},
+                                  mock.Mock()), [b'django'])
+        self.assertEqual(self.app({'REQUEST_METHOD': 'GET',
+                                   'PATH_INFO': '/static/../settings.py'},
+                                  mock.Mock()), [b'django'])
+
+
+    def test_base_template_assets_are_hashed_and_compressed(self):
+        with override_settings(
+                STATIC_ROOT=self.root,
+                STATICFILES_FINDERS=[
+                    'django.contrib.staticfiles.finders.FileSystemFinder'],
+                STATICFILES_STORAGE='yatube.staticfiles.'
+                                    'CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            html = self.client.get(reverse('index')).content.decode()
+        urls = re.findall(r'(?:href|src)="(/static/[^"]+)"', html)
+        self.assertEqual(len(urls), 3,
+                         msg='В base.html не найдены подключения статики')
+        for url in urls:
+            self.assertRegex(url, r'\.[0-9a-f]{12}\.(css|js)$',
+                             msg=f'{url} без хеша в имени')
+            body, headers = self.get(url, 'gzip')
+            self.assertEqual(headers['Content-Encoding'], 'gzip',
+                             msg=f'{url} отдаётся без сжатия')
+            self.assertIn('immutable', headers['Cache-Control'])
+
+
+class TestProductionProfile(TestCase):
+
+    def test_production_settings_are_lean(self):
+        script = (
+            'import json, django; django.setup(); '
+            'from django.conf import settings as s; '
+            'print(json.dumps([s.DEBUG, s.INSTALLED_APPS, s.MIDDLEWARE, '
+            's.TEMPLATES[0]["OPTIONS"].get("loaders")]))')
+        result = subprocess.run(
+            [sys.executable, '-c', script], check=True,
+            stdout=subprocess.PIPE, universal_newlines=True,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='yatube.settings',
+                     YATUBE_PROFILE='production'))
+        debug, apps, middleware, loaders = json.loads(result.stdout)
+        self.assertFalse(debug)
+        self.assertNotIn('debug_toolbar', apps)
+        self.assertFalse(any('debug_toolbar' in name for name in middleware))
+        self.assertEqual(loaders[0][0], 'django.template.loaders.cached.Loader')
+
+
+    def test_production_index_renders_after_collectstatic(self):
+        with tempfile.TemporaryDirectory() as folder:
+            env = dict(
+                os.environ, DJANGO_SETTINGS_MODULE='yatube.settings',
+                YATUBE_PROFILE='production',
+                YATUBE_DB_PATH=os.path.join(folder, 'db.sqlite3'),
+                YATUBE_CACHE_LOCATION=os.path.join(folder, 'cache.sqlite3'),
+                YATUBE_STATIC_ROOT=os.path.join(folder, 'static'))
+            for command in ('migrate', 'collectstatic'):
+                subprocess.run(
+                    [sys.executable, 'manage.py', command, '--noinput',
+                     '--verbosity', '0'], check=True, env=env)
+            script = (
+                'import django; django.setup(); '
+                'from django.test import Client; '
+                'response = Client().get("/"); '
+                'print(response.status_code); '
+                'print(response.content.decode())')
+            result = subprocess.run(
+                [sys.executable, '-c', script], env=env,
+                stdout=subprocess.PIPE, universal_newlines=True)
+        status, html = result.stdout.split('\n', 1)
+        self.assertEqual(status, '200',
+                         msg='Главная страница падает в production-профиле')
+        self.assertRegex(
+            html, r'/static/bootstrap/dist/css/bootstrap\.min\.[0-9a-f]{12}\.css',
+            msg='Стили подключены без хеша в имени')
+
+
+class TestSessions(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', password='12345')
+
+    def test_prune_sessions_deletes_only_expired_rows(self):
+        past = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create(
+            Session(session_key=f'old{n:037d}', session_data='',
+                    expire_date=past) for n in range(7))
+        live = SessionStore()
+        live.create()
+        out = StringIO()
+        call_command('prune_sessions', batch_size=3, pause=0, stdout=out)
+        self.assertIn('Deleted 7', out.getvalue(), msg='Удалены не все '
+                      'истёкшие сессии')
+        self.assertEqual(list(Session.objects.values_list(
+            'session_key', flat=True)), [live.session_key],
+            msg='Удалена действующая сессия')
+
+    def test_cookie_sessions_skip_the_session_table(self):
+        for engine in ('django.contrib.sessions.backends.cached_db',
+                       'django.contrib.sessions.backends.signed_cookies'):
+            with override_settings(SESSION_ENGINE=engine):
+                client = Client()
+                client.force_login(self.user)
+                client.get(reverse('follow_index'))
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(reverse('follow_index'))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(
+                any('django_session' in q['sql'] for q in captured),
+                msg=f'{engine} обращается к таблице сессий при чтении')
+
+
+# Names are forgotten on commit, which a TestCase never reaches.
+class TestUsernameResolver(TransactionTestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='writer', password='12345')
+        self.post = Post.objects.create(text='Текст', author=self.user)
+        self.client.force_login(self.user)
+
+    def test_unknown_username_gives_404(self):
+        for name in ('profile', 'profile_follow', 'profile_unfollow'):
+            response = self.client.get(reverse(name, args=['nobody']))
+            self.assertEqual(response.status_code, 404,
+                             msg=f'{name} не отдаёт 404 для чужого имени')
+        for name in ('post_view', 'post_edit', 'add_comment',
+                     'post_comments'):
+            response = self.client.get(
+                reverse(name, args=['nobody', self.post.id]))
+            self.assertEqual(response.status_code, 404,
+                             msg=f'{name} не отдаёт 404 для чужого имени')
+
+    def test_lookups_are_cached_both_ways(self):
+        usernames.resolve('writer')
+        usernames.resolve('ghost')
+        with self.assertNumQueries(0):
+            self.assertEqual(usernames.resolve('writer'), self.user.pk)
+            self.assertIsNone(usernames.resolve('ghost'))
+        ghost = User.objects.create_user(username='ghost')
+        self.assertEqual(usernames.resolve('ghost'), ghost.pk,
+                         msg='Новый пользователь остался «не найден»')
+
+    def test_post_view_skips_the_user_lookup(self):
+        url = reverse('post_view', args=['writer', self.post.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertFalse(
+            any('"username" =' in query['sql'] for query in captured),
+            msg='Страница поста ищет автора по имени в базе')
+
+    def test_rename_and_delete_invalidate(self):
+        usernames.resolve('writer')
+        self.user.username = 'author'
+        self.user.save()
+        self.assertIsNone(usernames.resolve('writer'))
+        self.assertEqual(usernames.resolve('author'), self.user.pk)
+        self.assertEqual(self.client.get(
+            reverse('profile', args=['writer'])).status_code, 404)
+
+        self.user.delete()
+        self.assertIsNone(usernames.resolve('author'))
+
+    def test_resolve_during_rename_does_not_cache_old_name(self):
+        def resolve_concurrently(sender, instance, **kwargs):
+            # Another request between the eviction and the commit still
+            # reads the old row.
+            self.assertEqual(usernames.resolve('writer'), self.user.pk)
+
+        usernames.resolve('writer')
+        pre_save.connect(resolve_concurrently, sender=User)
+        try:
+            with transaction.atomic():
+                self.user.username = 'author'
+                self.user.save()
+        finally:
+            pre_save.disconnect(resolve_concurrently, sender=User)
+        self.assertIsNone(usernames.resolve('writer'),
+            msg='Старое имя снова попало в кеш во время переименования')
+        self.assertEqual(usernames.resolve('author'), self.user.pk)
+
+
+class TestFollowEndpoints(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username='reader', password='12345')
+        self.author = User.objects.create_user(
+            username='author', password='12345')
+        self.client.force_login(self.reader)
+        self.follow_url = reverse('api_follow_user', args=['author'])
+        self.unfollow_url = reverse('api_unfollow_user', args=['author'])
+
+    def test_repeated_follow_counts_once(self):
+        self.assertTrue(follows.follow(self.reader.pk, self.author.pk))
+        with CaptureQueriesContext(connection) as captured:
+            self.assertFalse(follows.follow(self.reader.pk, self.author.pk))
+        statements = [query['sql'] for query in captured
+                      if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 1,
+                         msg='Повторная подписка не одним запросом')
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1,
+            msg='Повторная подписка изменила счётчик')
+
+        self.assertTrue(follows.unfollow(self.reader.pk, self.author.pk))
+        self.assertFalse(follows.unfollow(self.reader.pk, self.author.pk))
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 0)
+
+    def test_receivers_get_the_saved_row(self):
+        received = []
+
+        def receive(sender, instance, **kwargs):
+            received.append((instance.pk, instance._state.adding))
+
+        post_save.connect(receive, sender=Follow)
+        post_delete.connect(receive, sender=Follow)
+        try:
+            follows.follow(self.reader.pk, self.author.pk)
+            pk = Follow.objects.get().pk
+            follows.unfollow(self.reader.pk, self.author.pk)
+        finally:
+            post_save.disconnect(receive, sender=Follow)
+            post_delete.disconnect(receive, sender=Follow)
+        self.assertEqual(received, [(pk, False), (pk, False)],
+                         msg='Сигналы подписки получили объект без pk')
+
+    def test_json_endpoints_return_state_and_counts(self):
+        response = self.client.post(self.follow_url)
+        self.assertEqual(response.json(), {
+            'following': True, 'followers_count': 1, 'following_count': 1})
+        self.assertEqual(self.client.post(self.follow_url).json(),
+                         response.json(), msg='Подписка не идемпотентна')
+        response = self.client.post(self.unfollow_url)
+        self.assertEqual(response.json(), {
+            'following': False, 'followers_count': 0, 'following_count': 0})
+
+    def test_json_endpoints_reject_bad_requests(self):
+        self.assertEqual(self.client.get(self.follow_url).status_code, 405)
+        self.assertEqual(self.client.post(reverse(
+            'api_follow_user', args=['reader'])).status_code, 400)
+        self.assertEqual(self.client.post(reverse(
+            'api_follow_user', args=['nobody'])).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.post(self.follow_url).status_code, 401)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_follow_updates_the_timeline(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        self.client.get(reverse('profile_follow', args=['author']))
+        self.assertContains(self.client.get(reverse('follow_index')),
+                            post.text)
+        self.client.get(reverse('profile_unfollow', args=['author']))
+        self.assertNotContains(self.client.get(reverse('follow_index')),
+                               post.text)
@@ -0,0 +1,138 @@
+"""
+Thumbnail pre-generation.
+
+Building thumbnails inside the page request that first shows an image
+would make that request slow. Saving a post with a new image instead
+schedules them on a small background thread pool once the transaction
+commits, and the cached fragments of the post are dropped when they are
+ready; until then {% post_picture %} shows the original.
+
+The same pass writes responsive variants: the 960x339 crop at several
+widths in AVIF, WebP and JPEG, stored under predictable names next to
+each other so {% post_picture %} can build <picture> srcsets from the
+image name alone.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import get_thumbnail
+
+from . import fragments
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Geometry and options used by the {% thumbnail %} tags in the templates.
+VARIANTS = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
+
+# Responsive variants: widths of the 960x339 crop and the formats they
+# are written in, best compression first. Formats this Pillow build
+# cannot encode are skipped.
+WIDTHS = (320, 640, 960)
+ASPECT = 339 / 960
+FORMATS = [
+    ('AVIF', 'avif', {'quality': 55}),
+    ('WEBP', 'webp', {'quality': 80, 'method': 6}),
+    ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+]
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def formats():
+    Image.init()
+    return [entry for entry in FORMATS if entry[0] in Image.SAVE]
+
+
+def variant_name(image_name, width, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'variants/{stem}-{width}.{extension}'
+
+
+def build_variants(image):
+    """Writes every width and format of the responsive crop."""
+    with image.open('rb') as source:
+        picture = ImageOps.exif_transpose(Image.open(source))
+        picture.load()
+    if picture.mode not in ('RGB', 'L'):
+        picture = picture.convert('RGB')
+    for width in WIDTHS:
+        size = (width, round(width * ASPECT))
+        resized = ImageOps.fit(picture, size, Image.LANCZOS)
+        for image_format, extension, options in formats():
+            name = variant_name(image.name, width, extension)
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def srcsets(image):
+    """Maps MIME type to a srcset of the variants that exist on disk."""
+    result = {}
+    for image_format, extension, _ in formats():
+        candidates = []
+        for width in WIDTHS:
+            name = variant_name(image.name, width, extension)
+            if default_storage.exists(name):
+                candidates.append(f'{default_storage.url(name)} {width}w')
+        if candidates:
+            result[f'image/{image_format.lower()}'] = ', '.join(candidates)
+    return result
+
+
+def generate(image):
+    """Builds every template variant of an image file."""
+    for geometry, options in VARIANTS:
+        get_thumbnail(image, geometry, **options)
+    build_variants(image)
+
+
+def _generate_for_post(post_id):
+    try:
+        post = Post.objects.filter(pk=post_id).only(
+            'image', 'author', 'group').first()
+        if post is not None and post.image:
+            generate(post.image)
+            # Pages cached before now show the original image.
+            fragments.invalidate_post(post)
+    except Exception:
+        logger.exception('Could not build thumbnails for post %s', post_id)
+
+
+def generate_for_post(post_id):
+    """Worker entry point: loads the post and renders its thumbnails."""
+    close_old_connections()
+    try:
+        _generate_for_post(post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Queues thumbnail generation for a post after the current
+    transaction commits."""
+    if not post.image:
+        return
+    transaction.on_commit(
+        lambda: executor().submit(generate_for_post, post.pk))
@@ -0,0 +1,240 @@
+"""
+Materialized follow timelines.
+
+Every post is copied (fan-out on write) into the timeline of each follower
+of its author, so the follow feed reads one indexed range per user instead
+of an IN list over all followed authors. Authors with more followers than
+settings.TIMELINE_FANOUT_LIMIT are skipped on write and merged in on read.
+
+Timeline pages the user's entries along (user, -pub_date, -post) and each
+heavy author's posts along (author, -pub_date, -id), at most one page from
+each, and merges the streams in Python: every page costs 1 + (number of
+followed heavy authors) bounded index range reads and never a sort.
+
+Invariant: a heavy author has no timeline entries and a light author has
+all of theirs. followed() and unfollowed() keep it when a follow moves an
+author's follower count across the limit.
+"""
+import heapq
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .counters import stats_for
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import CursorPaginator, NEXT
+
+BATCH_SIZE = 500
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 10000)
+
+
+def follower_ids(author):
+    return (Follow.objects.filter(author=author, user__isnull=False)
+            .values_list('user', flat=True).distinct())
+
+
+def is_heavy_author(author):
+    return stats_for(author).followers_count >= fanout_limit()
+
+
+def _followers_count(author_id):
+    return UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True).first() or 0
+
+
+def fan_out(post):
+    """Pushes a freshly saved post into its author's followers' timelines."""
+    if is_heavy_author(post.author):
+        return
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids(post.author)),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Copies the existing posts of a newly followed light author; a
+    heavy author's posts are merged in on read anyway."""
+    if _followers_count(author_id) >= fanout_limit():
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    """Drops an unfollowed author's posts from the user's timeline."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def fill_author(author_id):
+    """Copies all of an author's posts into all their followers'
+    timelines in one statement."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TimelineEntry._meta.db_table} '
+            '(user_id, post_id, pub_date) '
+            'SELECT f.user_id, p.id, p.pub_date '
+            f'FROM {Follow._meta.db_table} f '
+            f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+            'WHERE f.author_id = %s AND f.user_id IS NOT NULL '
+            'ON CONFLICT DO NOTHING',
+            [author_id])
+
+
+def drop_author(author_id):
+    """Removes an author's posts from every timeline."""
+    TimelineEntry.objects.filter(post__author_id=author_id).delete()
+
+
+def followed(user_id, author_id):
+    """Timeline upkeep after a follow; run after the counters moved."""
+    if _followers_count(author_id) == fanout_limit():
+        # The author just became heavy: read on demand from now on.
+        drop_author(author_id)
+    else:
+        backfill(user_id, author_id)
+
+
+def unfollowed(user_id, author_id):
+    """Timeline upkeep after an unfollow; run after the counters moved."""
+    prune(user_id, author_id)
+    if _followers_count(author_id) == fanout_limit() - 1:
+        # The author just became light again: their posts written while
+        # heavy were never fanned out.
+        fill_author(author_id)
+
+
+def rebuild():
+    """Refills every timeline from the follow graph in one statement,
+    e.g. after bulk inserts that bypass the model signals."""
+    TimelineEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TimelineEntry._meta.db_table} '
+            '(user_id, post_id, pub_date) '
+            'SELECT DISTINCT f.user_id, p.id, p.pub_date '
+            f'FROM {Follow._meta.db_table} f '
+            f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+            'WHERE f.user_id IS NOT NULL AND f.author_id NOT IN ('
+            f' SELECT user_id FROM {UserStats._meta.db_table}'
+            ' WHERE followers_count >= %s)',
+            [fanout_limit()])
+
+
+def heavy_authors(user):
+    """Followed authors whose posts are read on demand, not fanned out."""
+    followed = Follow.objects.filter(user=user).values('author')
+    return UserStats.objects.filter(
+        user__in=followed, followers_count__gte=fanout_limit()
+    ).values('user')
+
+
+def timeline_posts(user):
+    """The follow feed as one queryset, for narrow primary key ranges
+    such as the live feed's pk__gt; pages go through Timeline."""
+    entries = TimelineEntry.objects.filter(user=user).values('post')
+    return Post.objects.filter(
+        Q(pk__in=entries) | Q(author__in=heavy_authors(user)))
+
+
+class Timeline:
+    """
+    A user's follow feed, newest first. Slicing it returns posts, so the
+    numbered Paginator works on it; cursor_paginator() gives the keyset
+    pages.
+    """
+
+    ordered = True
+
+    def __init__(self, user):
+        self.user = user
+        self.heavy = list(heavy_authors(user).values_list('user', flat=True))
+
+    def _streams(self, limit, position=None, older=True):
+        """One (pub_date, post id) stream per source, each at most limit
+        long and sorted in the requested direction."""
+        field, sign = ('-', 'lt') if older else ('', 'gt')
+        bound = 'lte' if older else 'gte'
+
+        def keyset(date_field, id_field):
+            if position is None:
+                return Q()
+            value, pk = position
+            return Q(**{f'{date_field}__{bound}': value}) & (
+                Q(**{f'{date_field}__{sign}': value})
+                | Q(**{f'{id_field}__{sign}': pk}))
+
+        yield (TimelineEntry.objects.filter(user=self.user)
+               .filter(keyset('pub_date', 'post_id'))
+               .order_by(f'{field}pub_date', f'{field}post_id')
+               .values_list('pub_date', 'post_id')[:limit])
+        for author_id in self.heavy:
+            yield (Post.objects.filter(author_id=author_id)
+                   .filter(keyset('pub_date', 'id'))
+                   .order_by(f'{field}pub_date', f'{field}id')
+                   .values_list('pub_date', 'id')[:limit])
+
+    def positions(self, limit, position=None, older=True):
+        """The first limit (pub_date, post id) pairs past position."""
+        merged = heapq.merge(
+            *(list(stream) for stream in
+              self._streams(limit, position, older)),
+            reverse=older)
+        result, seen = [], set()
+        for key in merged:
+            # A post can sit in both streams for the moment an author
+            # takes to cross the limit.
+            if key[1] not in seen:
+                seen.add(key[1])
+                result.append(key)
+                if len(result) == limit:
+                    break
+        return result
+
+    def posts(self, positions):
+        by_id = Post.objects.for_feed().in_bulk(
+            [pk for _, pk in positions])
+        return [by_id[pk] for _, pk in positions if pk in by_id]
+
+    def count(self):
+        heavy_posts = UserStats.objects.filter(user__in=self.heavy)
+        return (TimelineEntry.objects.filter(user=self.user).count()
+                + sum(heavy_posts.values_list('posts_count', flat=True)))
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step:
+            raise TypeError('Timeline only supports plain slices.')
+        start, stop = index.start or 0, index.stop
+        return self.posts(self.positions(stop)[start:])
+
+    def cursor_paginator(self, per_page):
+        return TimelinePaginator(self, per_page)
+
+
+class TimelinePaginator(CursorPaginator):
+    """CursorPaginator over a Timeline instead of a queryset."""
+
+    def _rows(self, position, direction, limit):
+        timeline = self.queryset
+        return timeline.posts(timeline.positions(
+            limit, position, older=direction == NEXT))
+
+    def _exists(self, position, direction):
+        return bool(self.queryset.positions(
+            1, position, older=direction == NEXT))
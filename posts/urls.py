@@ -1,14 +1,25 @@
 from django.urls import path
-from . import views 
+from . import api, views 
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('live/', views.live_posts, name='live_posts'),
+    path('search/', views.search_view, name='search'),
+    path('search/json/', views.search_json, name='search_json'),
+    path('api/v1/posts/', api.index, name='api_index'),
+    path('api/v1/posts/<int:post_id>/', api.post_detail, name='api_post'),
+    path('api/v1/follow/', api.follow_index, name='api_follow'),
+    path('api/v1/group/<slug:slug>/', api.group_posts, name='api_group'),
+    path('api/v1/profile/<username>/', api.profile, name='api_profile'),
+    path('api/v1/profile/<username>/follow/', api.follow, name='api_follow_user'),
+    path('api/v1/profile/<username>/unfollow/', api.unfollow, name='api_unfollow_user'),
     path('<username>/follow/', views.profile_follow, name='profile_follow'), 
     path('<username>/unfollow/', views.profile_unfollow, name='profile_unfollow'),
     path('new/', views.new_post, name='new_post'),
     path('<username>/', views.profile, name='profile'),
     path('<username>/<int:post_id>/', views.post_view, name='post_view'),
+    path('<username>/<int:post_id>/comments/', views.post_comments, name='post_comments'),
     path('<username>/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('<username>/<int:post_id>/comment/', views.add_comment, name='add_comment'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
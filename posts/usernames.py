@@ -0,0 +1,56 @@
+"""
+Cached username -> user id lookups for the user-scoped URLs.
+
+Every profile and post URL starts with a username, and resolve() answers
+it from the cache instead of the user table. Unknown names are cached too
+(as MISSING, for NEGATIVE_TIMEOUT seconds), so crawlers probing made-up
+profiles do not reach the database either.
+
+posts.signals forgets a name once the creation, rename or deletion of a
+user with it commits. QuerySet.update() sends no signals: forget() the affected names
+after renaming users that way.
+"""
+from django.core.cache import cache
+from django.http import Http404
+
+from yatube.routers import PRIMARY
+
+from .models import User
+
+TIMEOUT = 24 * 60 * 60
+NEGATIVE_TIMEOUT = 60
+
+# Primary keys start at 1, so 0 can stand for "no such user".
+MISSING = 0
+
+MAX_LENGTH = User._meta.get_field('username').max_length
+
+
+def _key(username):
+    return f'username:{username}'
+
+
+def resolve(username):
+    """Returns the id of the user with this username, or None."""
+    if len(username) > MAX_LENGTH:
+        return None
+    pk = cache.get(_key(username))
+    if pk is None:
+        # The cache is shared: fill it from the primary, never from a
+        # replica that may not have the user yet.
+        pk = User.objects.using(PRIMARY).filter(
+            username=username).values_list('pk', flat=True).first() or MISSING
+        cache.set(_key(username), pk,
+                  TIMEOUT if pk != MISSING else NEGATIVE_TIMEOUT)
+    return pk if pk != MISSING else None
+
+
+def resolve_or_404(username):
+    pk = resolve(username)
+    if pk is None:
+        raise Http404(f'No user named {username!r}.')
+    return pk
+
+
+def forget(*usernames):
+    cache.delete_many([_key(username) for username in usernames])
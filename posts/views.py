@@ -1,31 +1,42 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from .models import Comment, Follow, Group, Post, User
+from django.template.loader import render_to_string
+from django.views.decorators.http import etag
+from .models import Comment, Group, Post
 from .forms import CommentForm, PostForm
+from . import (
+    conditional, follows, fragments, live, search, thumbnails, usernames,
+    write_queue)
+from .counters import stats_for, stats_with_user
+from .paginators import comment_page, paginate
+from .timeline import Timeline, timeline_posts
+from yatube.db import atomic_retry
+from yatube.routers import replica_reads
 
 
+@replica_reads()
 def index(request):
-    post_list = Post.objects.order_by('-pub_date').all()
-    paginator = Paginator(post_list, 10)
-
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    paginator, page = paginate(request, post_list, count_scope='index')
     return render(request, 'index.html', {
-        'page': page, 'paginator': paginator
+        'page': page, 'paginator': paginator,
+        'feed_version': fragments.version('index'),
         })
 
 
+@replica_reads()
+@etag(conditional.group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.group_posts.order_by('-pub_date')
-    paginator = Paginator(post_list, 10)
-
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = group.group_posts.for_feed()
+    paginator, page = paginate(
+        request, post_list, count_scope=f'group:{group.pk}')
     return render(request, 'group.html', {
         'page': page, 'paginator': paginator,
-        'group': group
+        'group': group,
+        'feed_version': fragments.version(f'group:{group.pk}'),
         })
 
 
@@ -37,58 +48,84 @@ def new_post(request):
         if form.is_valid():
             new_post = form.save(commit=False) 
             new_post.author = request.user 
-            new_post.save()
+            write_queue.create(new_post)
+            thumbnails.schedule(new_post)
             return redirect('index')
     else:
         form = PostForm()
     return render(request, 'new.html', {'form': form})
 
 
+@replica_reads()
+@etag(conditional.profile_etag)
 def profile(request, username):
-    author = User.objects.get(username=username)
-    posts = author.author_posts.order_by('-pub_date')
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    stats = stats_with_user(usernames.resolve_or_404(username))
+    if stats is None:
+        raise Http404('No such user.')
+    author = stats.user
+    posts = author.author_posts.for_feed()
+    paginator, page = paginate(
+        request, posts, count_scope=f'profile:{author.pk}')
     follower=None
     if request.user.is_authenticated:
         follower = author.following.filter(user=request.user)
     return render(request, 'profile.html', {
         'author': author, 
+        'stats': stats,
         'posts': posts,
         'paginator': paginator, 
         'page': page, 
-        'follower': follower
+        'follower': follower,
+        'feed_version': fragments.version(f'profile:{author.pk}'),
         })
 
 
+@replica_reads()
+@etag(conditional.post_etag)
 def post_view(request, username, post_id):
-    author = User.objects.get(username=username)
-    post = get_object_or_404(Post, author=author, id=post_id)
-    posts_cnt = author.author_posts.count()
-    comments = post.post_comments.order_by('-created')
+    post = get_object_or_404(
+        Post.objects.select_related('author'),
+        author_id=usernames.resolve_or_404(username), id=post_id)
+    author = post.author
+    stats = stats_for(author)
+    comments = post.post_comments.select_related('author')
 
     form = CommentForm()
     return render(request, 'post.html', {
         'author': author, 
+        'stats': stats,
         'post': post, 
-        'posts_cnt': posts_cnt, 
+        'posts_cnt': stats.posts_count, 
         'comments': comments,
+        'comment_page': comment_page(request, comments),
         'form': form,
         })
 
 
+@replica_reads()
+def post_comments(request, username, post_id):
+    """The next comments of a post as an HTML fragment for "load more"."""
+    post = get_object_or_404(
+        Post.objects.select_related('author'),
+        author_id=usernames.resolve_or_404(username), id=post_id)
+    return render(request, 'comment_list.html', {
+        'post': post,
+        'comment_page': comment_page(
+            request, post.post_comments.select_related('author')),
+        })
+
+
 @login_required
 def add_comment(request, username, post_id):
-    author = User.objects.get(username=username)
-    post = Post.objects.get(pk=post_id)
+    post = get_object_or_404(
+        Post, author_id=usernames.resolve_or_404(username), pk=post_id)
     if request.method == 'POST':
         form = CommentForm(request.POST or None)
         if form.is_valid():
             new_comment = form.save(commit=False) 
             new_comment.author = request.user 
             new_comment.post = post
-            new_comment.save()
+            write_queue.create(new_comment)
     else:
         form = CommentForm()
     return redirect('post_view', username, post_id) 
@@ -96,10 +133,12 @@ def add_comment(request, username, post_id):
 
 @login_required
 def post_edit(request, username, post_id):
-    user = User.objects.get(username=username)
-    post = Post.objects.get(pk=post_id)
-    if user == post.author:
+    post = get_object_or_404(
+        Post.objects.select_related('author'),
+        author_id=usernames.resolve_or_404(username), pk=post_id)
+    if request.user == post.author:
         if request.method == 'POST':
+            old_group_id = post.group_id
             form = PostForm(
                 request.POST or None, 
                 files=request.FILES or None, 
@@ -107,7 +146,11 @@ def post_edit(request, username, post_id):
                 )
             if form.is_valid():
                 post = form.save(commit=False)
-                post.save() 
+                atomic_retry(post.save)
+                if 'image' in form.changed_data:
+                    thumbnails.schedule(post)
+                if old_group_id and old_group_id != post.group_id:
+                    fragments.bump(f'group:{old_group_id}')
                 return redirect('post_view', username, post_id)
             else: 
                 return render(request, 'new.html', {'form': form})
@@ -121,49 +164,124 @@ def post_edit(request, username, post_id):
         author = post.author
         return render(request, 'post.html', {
             'author': author, 
+            'stats': stats_for(author),
             'post': post
             })
 
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    follower_status = Follow.objects.filter(
-        user=request.user, author=author
-        ).exists()
-    if not follower_status:
-        if request.user != author:
-            Follow.objects.create(user=request.user, author=author)
+    author_id = usernames.resolve_or_404(username)
+    if request.user.pk != author_id:
+        follows.follow(request.user.pk, author_id)
     return redirect('profile', username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    follower_status = Follow.objects.filter(
-        user=request.user, author=author
-        ).exists()
-    if follower_status:
-        Follow.objects.filter(user=request.user, author=author).delete()
+    follows.unfollow(request.user.pk, usernames.resolve_or_404(username))
     return redirect('profile', username)
             
     
+@replica_reads()
 @login_required
 def follow_index(request):
-    all_follows = Follow.objects.filter(user=request.user)
-    authors = (i.author for i in all_follows)
-    post_list = Post.objects.filter(author__in=authors).order_by('-pub_date')
-
-    paginator = Paginator(post_list, 10)
-
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator, page = paginate(request, Timeline(request.user))
 
     return render(request, 'follow.html', {
         'page': page, 'paginator': paginator,
         })
 
 
+def live_posts(request):
+    """
+    Posts newer than ?after= (or Last-Event-ID) in the ?feed=index,
+    ?feed=group&group=<slug> or ?feed=follow feed, each with its rendered
+    post_list.html fragment. With LIVE_FEED = 'stream' it is a Server-Sent
+    Events stream for EventSource clients and one long-poll JSON answer for
+    everybody else; with 'poll' every answer is JSON and returns at once.
+    """
+    mode = getattr(settings, 'LIVE_FEED', 'off')
+    if mode not in ('poll', 'stream'):
+        raise Http404('The live feed is off.')
+    feed = request.GET.get('feed', 'index')
+    if feed == 'follow':
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'login required'}, status=401)
+        posts, scope = timeline_posts(request.user), 'index'
+    elif feed == 'group':
+        group = get_object_or_404(Group, slug=request.GET.get('group'))
+        posts, scope = group.group_posts.all(), f'group:{group.pk}'
+    else:
+        posts, scope = Post.objects.all(), 'index'
+    try:
+        after = int(request.META.get('HTTP_LAST_EVENT_ID')
+                    or request.GET.get('after') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'bad cursor'}, status=400)
+
+    def fetch(after):
+        newer = posts.for_feed().filter(pk__gt=after).order_by('pk')
+        return [(post.pk, render_to_string(
+                    'post_list.html', {'page': [post], 'user': request.user}))
+                for post in newer[:live.BATCH_SIZE]]
+
+    if mode == 'poll':
+        found, cursor = live.poll(scope, after, fetch, 0)
+    elif 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+        response = StreamingHttpResponse(
+            live.stream(scope, after, fetch),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    else:
+        found, cursor = live.poll(
+            scope, after, fetch, getattr(settings, 'LIVE_POLL_SECONDS', 25))
+    return JsonResponse({
+        'posts': [{'id': pk, 'html': html} for pk, html in found],
+        'cursor': cursor,
+        })
+
+
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    posts = users = []
+    if query:
+        posts = search.search_posts(query)
+        users = search.search_users(query)
+    return render(request, 'search.html', {
+        'query': query, 'posts': posts, 'users': users,
+        })
+
+
+def search_json(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'bad limit or offset'}, status=400)
+    if offset > search.MAX_OFFSET:
+        return JsonResponse(
+            {'error': f'offset is limited to {search.MAX_OFFSET}'}, status=400)
+    posts = search.search_posts(query, limit=limit, offset=offset)
+    users = search.search_users(query) if not offset else []
+    return JsonResponse({
+        'query': query,
+        'posts': [{
+            'id': post.pk,
+            'author': post.author.username,
+            'pub_date': post.pub_date.isoformat(),
+            'snippet': post.snippet,
+        } for post in posts],
+        'users': [{
+            'username': user.username,
+            'full_name': user.get_full_name(),
+        } for user in users],
+        })
+
+
 def page_not_found(request, exception):
     return render(request, 'misc/404.html', 
         {'path': request.path}, status=404)
@@ -0,0 +1,136 @@
+"""
+Optional write-behind queue for new comments and posts.
+
+With WRITE_BEHIND on (YATUBE_WRITE_BEHIND=1) add_comment and new_post
+hand their unsaved objects to one flusher thread per process instead of
+committing a transaction each. The flusher collects whatever arrives
+within WRITE_QUEUE_MAX_DELAY seconds (at most WRITE_QUEUE_BATCH_SIZE
+objects) and writes it in a single transaction, so a burst of comments on
+a popular post takes SQLite's write lock once instead of once per
+comment.
+
+create() still returns only after that transaction committed, and it
+raises what the write raised, so the redirect that follows shows the
+user's own write exactly as before.
+
+Comments are bulk-inserted and their model signals are replaced by one
+counter update and one fragment invalidation per post. Posts are saved
+one by one inside the batch, because their signal receivers need the
+new primary key.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from . import counters, fragments
+from .models import Comment, Post
+from yatube import routers
+from yatube.db import atomic_retry, create_retrying
+
+
+def enabled():
+    return getattr(settings, 'WRITE_BEHIND', False)
+
+
+def write_batch(objs):
+    """Inserts unsaved posts and comments; runs in one transaction."""
+    comments = [obj for obj in objs if isinstance(obj, Comment)]
+    for obj in objs:
+        if not isinstance(obj, Comment):
+            # A failed attempt may have assigned a pk that was rolled back.
+            obj.pk = None
+            obj.save()
+    if not comments:
+        return
+    Comment.objects.bulk_create(comments)
+    per_post = Counter(comment.post_id for comment in comments)
+    for post_id, added in per_post.items():
+        counters.bump_comments(post_id, added)
+    for post in Post.objects.filter(pk__in=per_post):
+        fragments.invalidate_post(post)
+
+
+class _Entry:
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.error = None
+        self.done = threading.Event()
+
+
+class WriteQueue:
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, obj):
+        """Queues an unsaved object and waits until it is committed."""
+        entry = _Entry(obj)
+        self._start()
+        self._queue.put(entry)
+        timeout = getattr(settings, 'WRITE_QUEUE_TIMEOUT', 30)
+        if not entry.done.wait(timeout):
+            raise TimeoutError(f'Write not committed within {timeout}s.')
+        if entry.error is not None:
+            raise entry.error
+        return obj
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = getattr(settings, 'WRITE_QUEUE_BATCH_SIZE', 100)
+        deadline = time.monotonic() + getattr(
+            settings, 'WRITE_QUEUE_MAX_DELAY', 0.01)
+        while len(batch) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self.flush(self._collect())
+
+    def flush(self, batch):
+        try:
+            atomic_retry(write_batch, [entry.obj for entry in batch])
+        except Exception:
+            # One bad object must not fail its neighbours: write them
+            # separately so only its own caller gets the error.
+            for entry in batch:
+                try:
+                    atomic_retry(write_batch, [entry.obj])
+                except Exception as error:
+                    entry.error = error
+        finally:
+            for entry in batch:
+                entry.done.set()
+
+
+_write_queue = WriteQueue()
+
+
+def create(obj):
+    """Saves a new comment or post, through the queue when WRITE_BEHIND
+    is on."""
+    if not enabled():
+        return create_retrying(obj)
+    # The flusher thread writes, but the pin to the primary belongs to
+    # this request.
+    routers.note_write()
+    return _write_queue.submit(obj)
@@ -0,0 +1,18 @@
+import pytest
+
+
+class InlineExecutor:
+
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    # A second connection to the shared in-memory test database fails with
+    # "table is locked" instead of waiting, so the thumbnails of uploaded
+    # images are built in the test's own thread, not on the pool.
+    from posts import thumbnails
+    monkeypatch.setattr(thumbnails, 'executor', InlineExecutor)
+    return settings.MEDIA_ROOT
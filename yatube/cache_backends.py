@@ -0,0 +1,190 @@
+"""
+Cache backend shared by every worker process on a host.
+
+LocMemCache gives each gunicorn worker its own copy of the cache, so the
+fragment versions bumped by one worker are invisible to the others and
+the hit rate drops as workers are added. SQLiteCache keeps entries in
+one WAL-mode SQLite file instead: all workers read the same rows, writes
+(including incr() on the fragment version counters) are serialized by
+SQLite's write lock, and the table is held to about MAX_ENTRIES rows by
+evicting the least recently used keys.
+
+Counting the rows is a full scan, so a process checks the size only once
+every CULL_EVERY writes (by default 1% of MAX_ENTRIES); between checks
+the table may grow past MAX_ENTRIES by that many rows per process.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.cache_backends.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000, 'CULL_EVERY': 100},
+        }
+    }
+"""
+import itertools
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Reads refresh a key's LRU position at most this often, so hot keys do
+# not turn every cache hit into a write.
+TOUCH_INTERVAL = 1.0
+
+# Default CULL_EVERY as a share of MAX_ENTRIES.
+CULL_CHECK_SHARE = 0.01
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+
+class SQLiteCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._location = location
+        self._local = threading.local()
+        self._cull_every = int(params.get('OPTIONS', {}).get(
+            'CULL_EVERY', max(1, self._max_entries * CULL_CHECK_SHARE)))
+        self._writes = itertools.count(1)
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(
+                self._location, timeout=30, isolation_level=None,
+                check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            self._local.db = db
+        return db
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, key, value, timeout, replace=True):
+        now = time.time()
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if not replace:
+                # A stale row must not block add().
+                db.execute(
+                    'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                    (key, now))
+            cursor = db.execute(
+                f'{verb} INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 self.get_backend_timeout(timeout), now))
+            written = cursor.rowcount > 0
+            if written and next(self._writes) % self._cull_every == 0:
+                self._cull(db, now)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return written
+
+    def _cull(self, db, now):
+        (total,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if total <= self._max_entries:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        db.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT'
+            ' max(0, (SELECT COUNT(*) FROM cache) - ?))',
+            (self._max_entries,))
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        db = self._db
+        row = db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now))
+            return default
+        if now - accessed > TOUCH_INTERVAL:
+            db.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(self._key(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._write(
+            self._key(key, version), value, timeout, replace=False)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), time.time(), key,
+             time.time()))
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic across processes: the read and the write happen under
+        one IMMEDIATE transaction."""
+        key = self._key(key, version)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time(),
+                 key))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return value
+
+    def delete(self, key, version=None):
+        self._db.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def has_key(self, key, version=None):
+        row = self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time())).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connections are per thread and reused across requests.
+        pass
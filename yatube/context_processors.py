@@ -1,6 +1,15 @@
 import datetime as dt
 
+from django.conf import settings
+
 
 def year(request):
     current_year = dt.datetime.now().year
-    return {'year': current_year}
\ No newline at end of file
+    return {'year': current_year}
+
+
+def live_feed(request):
+    return {
+        'live_feed': getattr(settings, 'LIVE_FEED', 'off'),
+        'live_poll_interval': getattr(settings, 'LIVE_POLL_INTERVAL', 10),
+        }
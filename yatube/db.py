@@ -0,0 +1,94 @@
+"""
+SQLite tuning for the production database profile.
+
+apply_pragmas() runs on every new connection (it is connected to
+connection_created in PostsConfig.ready) and applies settings.SQLITE_PRAGMAS:
+WAL lets readers go on while add_comment or new_post write,
+synchronous=NORMAL drops the fsync per commit that WAL makes unnecessary,
+and mmap_size / cache_size keep hot pages in memory across requests now
+that connections persist (CONN_MAX_AGE).
+
+Writers still queue on SQLite's single write lock. The busy timeout makes
+them wait for it, but a transaction that read before writing can still
+fail at once with "database is locked", so write paths go through
+atomic_retry(), which reruns the whole transaction with backoff.
+"""
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+
+LOCKED_MESSAGE = 'database is locked'
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+    return (isinstance(error, OperationalError)
+            and LOCKED_MESSAGE in str(error))
+
+
+def atomic_retry(func, *args, **kwargs):
+    """Runs func in a transaction, retrying it while the database is
+    locked. Inside an outer transaction the error is left to the caller,
+    which has to roll back and retry all of it."""
+    attempts = getattr(settings, 'SQLITE_LOCK_RETRIES', 3)
+    delay = getattr(settings, 'SQLITE_LOCK_RETRY_DELAY', 0.05)
+    for attempt in range(attempts + 1):
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except OperationalError as error:
+            if (not is_locked(error) or attempt == attempts
+                    or connection.in_atomic_block):
+                raise
+        # Jitter keeps the retrying writers from colliding again.
+        time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def _insert(obj):
+    # A failed attempt may have assigned a pk that was rolled back.
+    obj.pk = None
+    obj.save()
+    return obj
+
+
+def create_retrying(obj):
+    """Inserts an unsaved model instance with atomic_retry()."""
+    return atomic_retry(_insert, obj)
+
+
+def copy_database(path, using='default'):
+    """Copies the database behind `using` into the SQLite file at path
+    with the sqlite3 backup API: a consistent snapshot that does not stop
+    writers on a WAL primary, and readers of the copy wait for the lock
+    instead of seeing a half-written file.
+
+    The copy is stamped with a new generation in PRAGMA user_version
+    (see yatube.routers.snapshot). It is set after the data, so a reader
+    can only see newer data under the old generation, never older."""
+    source = connections[using]
+    if source.in_atomic_block:
+        # The backup would wait forever for the open transaction.
+        raise RuntimeError('copy_database() cannot run in a transaction.')
+    source.ensure_connection()
+    target = sqlite3.connect(path, timeout=30)
+    try:
+        (previous,) = target.execute('PRAGMA user_version').fetchone()
+        source.connection.backup(target)
+        # Seconds since the epoch keep generations unique even after the
+        # replica file is recreated.
+        generation = max(previous + 1, int(time.time()))
+        target.execute(f'PRAGMA user_version = {generation}')
+        target.commit()
+    finally:
+        target.close()
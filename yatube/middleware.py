@@ -0,0 +1,198 @@
+"""
+Project middleware.
+
+ServerTimingMiddleware records, for a sampled share of requests, the SQL
+query count and time, the template render time and the cache hits and
+misses, and reports them both as a Server-Timing response header (shown
+by browser dev tools) and as one JSON log line on the
+'yatube.performance' logger.
+
+The hooks stay cheap enough for production: SQL is timed through
+connection.execute_wrapper() instead of the debug cursor, and the
+template and cache wrappers are installed once per process and only do a
+thread-local lookup when the current request is not sampled.
+
+ReplicaPinMiddleware keeps a client's reads on the primary database for
+a while after it wrote (see yatube.routers).
+"""
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.backends.django import Template
+
+from . import routers
+
+logger = logging.getLogger('yatube.performance')
+
+_local = threading.local()
+_installed = False
+
+
+class Recorder:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def metrics(self):
+        return {
+            'total_ms': round(
+                (time.perf_counter() - self.started) * 1000, 2),
+            'db_ms': round(self.db_time * 1000, 2),
+            'db_queries': self.queries,
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def current():
+    return getattr(_local, 'recorder', None)
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, *args, **kwargs):
+        recorder = current()
+        if recorder is None:
+            return render(self, *args, **kwargs)
+        # Only the outermost render counts; nested renders are inside it.
+        recorder.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            recorder.template_depth -= 1
+            if not recorder.template_depth:
+                recorder.template_time += time.perf_counter() - started
+    return wrapper
+
+
+_MISSING = object()
+
+
+def _counted_get(get):
+    @functools.wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        recorder = current()
+        if recorder is None:
+            return get(self, key, default, version)
+        value = get(self, key, _MISSING, version)
+        if value is _MISSING:
+            recorder.cache_misses += 1
+            return default
+        recorder.cache_hits += 1
+        return value
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @functools.wraps(get_many)
+    def wrapper(self, keys, version=None):
+        found = get_many(self, keys, version)
+        recorder = current()
+        if recorder is not None:
+            keys = list(keys)
+            recorder.cache_hits += len(found)
+            recorder.cache_misses += len(keys) - len(found)
+        return found
+    return wrapper
+
+
+def install():
+    """Wraps template rendering and the configured cache backends once
+    per process."""
+    global _installed
+    if _installed:
+        return
+    Template.render = _timed_render(Template.render)
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        if not getattr(backend.get, '_server_timing', False):
+            backend.get = _counted_get(backend.get)
+            backend.get._server_timing = True
+            # BaseCache.get_many() calls get(); only wrap real overrides.
+            if 'get_many' in vars(backend):
+                backend.get_many = _counted_get_many(backend.get_many)
+    _installed = True
+
+
+class ServerTimingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 1.0)
+        install()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = Recorder()
+        _local.recorder = recorder
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _local.recorder = None
+
+        metrics = recorder.metrics()
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={metrics["db_ms"]};desc="{metrics["db_queries"]} queries"',
+            f'tpl;dur={metrics["template_ms"]}',
+            f'cache;desc="{metrics["cache_hits"]} hits, '
+            f'{metrics["cache_misses"]} misses"',
+            f'total;dur={metrics["total_ms"]}',
+        ))
+        logger.info(json.dumps(dict(
+            metrics,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+        )))
+        return response
+
+
+class ReplicaPinMiddleware:
+
+    COOKIE = 'primary_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not routers.replicas():
+            return self.get_response(request)
+        routers.begin(pinned=self.COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if routers.wrote():
+                response.set_cookie(
+                    self.COOKIE, '1', httponly=True,
+                    max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+        finally:
+            routers.begin()
+        return response
@@ -0,0 +1,110 @@
+"""
+Read/write split between the primary database and read replicas.
+
+Writes always go to 'default'. Reads go to a random alias from
+settings.DATABASE_REPLICAS, but only inside views wrapped in
+replica_reads, i.e. the feeds and profile pages whose data may be a few
+seconds old; logins, forms and everything else keep reading the primary.
+
+Replicas lag behind the primary until the next sync_replicas run, so a
+user must not lose sight of their own writes: once a request writes,
+its remaining reads go to the primary, and ReplicaPinMiddleware
+(yatube.middleware) sets a cookie that keeps that client's reads on the
+primary for REPLICA_PIN_SECONDS.
+
+A request reads from one replica only, picked on its first read, so its
+pages never mix two sync states. Replica data must not leak into the
+shared fragment and ETag caches under the primary's keys either:
+snapshot() names the replica and its sync generation (stamped by
+yatube.db.copy_database), and posts.fragments adds it to every version.
+"""
+import random
+import threading
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def begin(pinned=False):
+    """Resets the routing state at the start of a request."""
+    _state.pinned = pinned
+    _state.wrote = False
+    _state.alias = None
+    _state.generation = None
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def note_write():
+    """Sends the rest of this request's reads to the primary."""
+    _state.wrote = True
+
+
+def read_alias():
+    """The alias the ORM reads from now; the first replica read of a
+    request picks the replica for the rest of it."""
+    aliases = replicas()
+    if (not aliases
+            or not getattr(_state, 'replica', 0)
+            or getattr(_state, 'pinned', False)
+            or wrote()):
+        return PRIMARY
+    if getattr(_state, 'alias', None) not in aliases:
+        _state.alias = random.choice(aliases)
+        _state.generation = None
+    return _state.alias
+
+
+def snapshot():
+    """'<alias>.<generation>' of the replica this request reads, or None
+    when it reads the primary."""
+    alias = read_alias()
+    if alias == PRIMARY:
+        return None
+    if _state.generation is None:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('PRAGMA user_version')
+            (_state.generation,) = cursor.fetchone()
+    return f'{alias}.{_state.generation}'
+
+
+class replica_reads(ContextDecorator):
+    """Lets the ORM reads inside the block or view go to a replica."""
+
+    # One instance serves every thread running the view, so the nesting
+    # depth lives in the thread-local state, not on self.
+
+    def __enter__(self):
+        _state.replica = getattr(_state, 'replica', 0) + 1
+
+    def __exit__(self, *exc_info):
+        _state.replica -= 1
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        note_write()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary, so any pair may be related.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary with the data.
+        return db not in replicas()
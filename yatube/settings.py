@@ -8,11 +8,17 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
 
+# YATUBE_PROFILE=production drops DEBUG and the debug toolbar, caches
+# compiled templates and switches the database, static files and request
+# sampling below to their production defaults.
+PRODUCTION = os.environ.get('YATUBE_PROFILE') == 'production'
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'rj6mla9qgy=z6qgwh-^l-dt@bx8+^*b719!u3lxat_%#q!b8v9'
+SECRET_KEY = os.environ.get(
+    'YATUBE_SECRET_KEY', 'rj6mla9qgy=z6qgwh-^l-dt@bx8+^*b719!u3lxat_%#q!b8v9')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
 ALLOWED_HOSTS = [
         'localhost',
@@ -20,6 +26,8 @@ ALLOWED_HOSTS = [
         '[::1]',
         'testserver',
 ]
+if os.environ.get('YATUBE_ALLOWED_HOSTS'):
+    ALLOWED_HOSTS = os.environ['YATUBE_ALLOWED_HOSTS'].split(',')
 
 # Application definition
 
@@ -34,12 +42,14 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
-    'debug_toolbar',
-    'sorl.thumbnail'
+    'sorl.thumbnail',
 ]
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'yatube.middleware.ServerTimingMiddleware',
+    'yatube.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +58,10 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if DEBUG:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware'),
+        'debug_toolbar.middleware.DebugToolbarMiddleware')
 
 INTERNAL_IPS = [
     "127.0.0.1",
@@ -70,10 +84,22 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'yatube.context_processors.year',
+                'yatube.context_processors.live_feed',
             ],
         },
     },
 ]
+if PRODUCTION:
+    # Templates are compiled once per process instead of on every render.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+    TEMPLATES[0]['OPTIONS']['context_processors'].remove(
+        'django.template.context_processors.debug')
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
@@ -84,10 +110,57 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get(
+            'YATUBE_DB_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
     }
 }
 
+# PRAGMAs applied to every new SQLite connection (see yatube.db).
+SQLITE_PRAGMAS = {}
+
+# Retries of a write transaction that failed with "database is locked".
+SQLITE_LOCK_RETRIES = 3
+SQLITE_LOCK_RETRY_DELAY = 0.05
+
+# YATUBE_DB_PROFILE=production keeps connections open between requests
+# and tunes SQLite for concurrent readers and writers.
+DB_PROFILE = os.environ.get(
+    'YATUBE_DB_PROFILE', 'production' if PRODUCTION else 'default')
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_DB_CONN_MAX_AGE', 600)),
+        # Seconds a writer waits for the lock (SQLite's busy timeout).
+        'OPTIONS': {'timeout': int(os.environ.get('YATUBE_DB_TIMEOUT', 20))},
+    })
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        # Negative means KiB: 64 MiB of page cache per connection.
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+    }
+
+# YATUBE_DB_REPLICAS=N adds N read replicas next to the primary file; the
+# feed views read from them (see yatube.routers) and sync_replicas copies
+# the primary into them.
+DATABASE_REPLICAS = []
+for number in range(1, int(os.environ.get('YATUBE_DB_REPLICAS', 0)) + 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=os.path.join(os.path.dirname(DATABASES['default']['NAME']),
+                          f'db-{alias}.sqlite3'),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['yatube.routers.ReplicaRouter']
+
+# Seconds a client keeps reading the primary after its own write; should
+# exceed the sync_replicas interval.
+REPLICA_PIN_SECONDS = int(os.environ.get('YATUBE_REPLICA_PIN_SECONDS', 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -128,7 +201,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
-STATIC_ROOT= os.path.join(BASE_DIR, 'static')
+STATIC_ROOT= os.environ.get(
+    'YATUBE_STATIC_ROOT', os.path.join(BASE_DIR, 'static'))
+# Vendored Bootstrap 4.5.3 and jQuery 3.6.1, laid out as their dist/
+# folders; collectstatic copies them into STATIC_ROOT.
+STATICFILES_DIRS = [os.path.join(BASE_DIR, 'assets')]
+
+# YATUBE_STATIC=manifest makes collectstatic write content-hashed names
+# with gzip/brotli copies, which yatube.wsgi serves with far-future
+# caching. Templates then need the collected manifest.
+if os.environ.get(
+        'YATUBE_STATIC', 'manifest' if PRODUCTION else 'plain') == 'manifest':
+    STATICFILES_STORAGE = (
+        'yatube.staticfiles.CompressedManifestStaticFilesStorage')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -149,3 +234,90 @@ CACHES = {
                 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         }
 }
+
+# YATUBE_CACHE=shared makes every worker process on the host use one
+# SQLite-backed cache instead of a private LocMemCache each.
+if os.environ.get(
+        'YATUBE_CACHE', 'shared' if PRODUCTION else 'local') == 'shared':
+    CACHES['default'] = {
+            'BACKEND': 'yatube.cache_backends.SQLiteCache',
+            'LOCATION': os.environ.get(
+                'YATUBE_CACHE_LOCATION',
+                os.path.join(BASE_DIR, 'cache.sqlite3')),
+            'OPTIONS': {
+                'MAX_ENTRIES': int(
+                    os.environ.get('YATUBE_CACHE_MAX_ENTRIES', 10000)),
+            },
+    }
+
+
+# YATUBE_SESSIONS picks where sessions live:
+#   db              one SELECT per authenticated request (the default
+#                   outside production);
+#   cached_db       read from the cache, written through to the database;
+#                   needs the shared cache once there are several workers
+#                   (the production default);
+#   signed_cookies  no server-side storage, data signed into the cookie.
+# benchmark_sessions on the production profile, follow feed of the
+# busiest reader: 1 client db 81-90, cached_db 89-116, signed_cookies
+# 88-109 req/s; 8 threads all three 80 req/s (the GIL is the limit).
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get(
+    'YATUBE_SESSIONS', 'cached_db' if PRODUCTION else 'db')]
+SESSION_COOKIE_HTTPONLY = True
+
+
+# Share of requests that get Server-Timing headers and a
+# 'yatube.performance' log line (see yatube.middleware).
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get(
+    'YATUBE_SERVER_TIMING_SAMPLE_RATE', 0.01 if PRODUCTION else 1.0))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'yatube.performance': {
+            'handlers': ['console'],
+            'level': os.environ.get(
+                'YATUBE_PERFORMANCE_LOG_LEVEL',
+                'WARNING' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# YATUBE_LIVE_FEED turns on the live feed (see posts.live):
+#   off     no live updates, the default;
+#   poll    pages ask for new posts every LIVE_POLL_INTERVAL seconds and
+#           every answer returns at once, fine for sync workers;
+#   stream  Server-Sent Events and long polls, each holding a worker for
+#           up to LIVE_STREAM_SECONDS / LIVE_POLL_SECONDS. Only run it on
+#           threaded or async workers (gunicorn --worker-class gthread or
+#           gevent): on sync workers a few open tabs take all of them.
+LIVE_FEED = os.environ.get('YATUBE_LIVE_FEED', 'off')
+LIVE_POLL_INTERVAL = 10
+# Longest wait of a live feed long-poll request and lifetime of one
+# live feed event stream in the stream mode, in seconds.
+LIVE_POLL_SECONDS = 25
+LIVE_STREAM_SECONDS = 55
+
+# YATUBE_WRITE_BEHIND=1 batches new comments and posts into shared
+# transactions (see posts.write_queue); callers still wait for the commit.
+WRITE_BEHIND = os.environ.get('YATUBE_WRITE_BEHIND') == '1'
+WRITE_QUEUE_BATCH_SIZE = 100
+WRITE_QUEUE_MAX_DELAY = 0.01
+WRITE_QUEUE_TIMEOUT = 30
+
+# Background threads that pre-build thumbnails of uploaded post images.
+THUMBNAIL_WORKERS = 2
+
+# Authors with at least this many followers are not fanned out into
+# follower timelines on write; their posts are merged in on read.
+TIMELINE_FANOUT_LIMIT = 10000
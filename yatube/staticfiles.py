@@ -0,0 +1,140 @@
+"""
+Fingerprinted, precompressed static files served by the WSGI app.
+
+CompressedManifestStaticFilesStorage is ManifestStaticFilesStorage (file
+names carry a hash of their content) that also writes a .gz copy, and a
+.br copy when the optional brotli package is installed, of every text
+asset during collectstatic.
+
+PrecompressedStaticFiles wraps the WSGI application (see yatube.wsgi)
+and answers STATIC_URL requests straight from STATIC_ROOT: it picks the
+smallest encoding the client accepts, and marks hashed names immutable
+for a year, since a changed file gets a new name.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = (
+    '.css', '.js', '.map', '.svg', '.html', '.txt', '.json', '.xml',
+    '.ico', '.ttf', '.otf', '.eot',
+)
+
+# Precompressed copies in order of preference, as (encoding, suffix).
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Names ManifestStaticFilesStorage gives to files: name.<12 hex>.ext
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SHORT_LIVED = 'public, max-age=60'
+
+
+def compress(path):
+    """Writes .gz (and .br) next to path unless they do not save at
+    least 5% of the size."""
+    with open(path, 'rb') as source:
+        data = source.read()
+    copies = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        copies.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in copies:
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in names:
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress(self.path(name))
+
+
+def accepted_encodings(header):
+    """Content codings the Accept-Encoding header allows."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles:
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = root or settings.STATIC_ROOT
+        self.prefix = prefix or settings.STATIC_URL
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if (environ.get('REQUEST_METHOD') not in ('GET', 'HEAD')
+                or not path.startswith(self.prefix)):
+            return self.application(environ, start_response)
+        name = path[len(self.prefix):]
+        try:
+            full_path = safe_join(self.root, name)
+        except (SuspiciousFileOperation, ValueError):
+            full_path = None
+        if (not full_path or name.endswith(('.gz', '.br'))
+                or not os.path.isfile(full_path)):
+            return self.application(environ, start_response)
+        return self.serve(environ, start_response, name, full_path)
+
+    def serve(self, environ, start_response, name, full_path):
+        content_type, _ = mimetypes.guess_type(full_path)
+        headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Cache-Control', IMMUTABLE if HASHED_NAME_RE.search(name)
+             else SHORT_LIVED),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(full_path + suffix):
+                full_path += suffix
+                headers.append(('Content-Encoding', encoding))
+                break
+        stat = os.stat(full_path)
+        headers += [
+            ('Content-Length', str(stat.st_size)),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+        ]
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        stream = open(full_path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(stream)
+        return _chunks(stream)
+
+
+def _chunks(stream):
+    with stream:
+        yield from iter(lambda: stream.read(64 * 1024), b'')
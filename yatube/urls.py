@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.conf.urls.static import static
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.conf.urls import handler404, handler500
 from django.contrib import admin
 from django.contrib.flatpages import views
@@ -26,4 +27,4 @@ if settings.DEBUG:
         import debug_toolbar
         urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
         urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-        urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
+        urlpatterns += staticfiles_urlpatterns()
\ No newline at end of file
@@ -13,4 +13,6 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
-application = get_wsgi_application()
+from yatube.staticfiles import PrecompressedStaticFiles  # noqa: E402
+
+application = PrecompressedStaticFiles(get_wsgi_application())